@@ -16,6 +16,8 @@ from app.db.postgres.models import User  # noqa
 from app.db.postgres.models import Rating  # noqa
 from app.db.postgres.models import Interaction  # noqa
 from app.db.postgres.models import Recommendation  # noqa
+from app.db.postgres.models import BookRatingStats  # noqa
+from app.db.postgres.models import UserRatingStats  # noqa
 
 # Это нужно, чтобы избежать ошибки с formatters
 try:
@@ -0,0 +1,45 @@
+"""rating, recommendation and interaction indexes
+
+Revision ID: 3f9d0b6a2c18
+Revises: 7c2e91a4b3f0
+Create Date: 2026-10-18 11:02:17.530962
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9d0b6a2c18'
+down_revision: Union[str, None] = '7c2e91a4b3f0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    duplicates = op.get_bind().execute(sa.text(
+        "SELECT COUNT(*) FROM (SELECT 1 FROM ratings GROUP BY user_id, book_id HAVING COUNT(*) > 1) d"
+    )).scalar()
+    if duplicates:
+        raise RuntimeError(
+            f"{duplicates} (user_id, book_id) pairs have more than one rating, "
+            "remove the duplicates before adding the unique index"
+        )
+
+    # Leading user_id also serves the per-user lookups, INCLUDE makes them index-only
+    op.create_index('ix_ratings_user_id_book_id', 'ratings', ['user_id', 'book_id'], unique=True,
+                    postgresql_include=['rating'])
+    op.create_index('ix_ratings_book_id', 'ratings', ['book_id'], postgresql_include=['user_id', 'rating'])
+    op.create_index('ix_recommendations_user_id_algorithm_score', 'recommendations',
+                    ['user_id', 'algorithm', 'score'], postgresql_include=['book_id', 'generated_at'])
+    op.create_index('ix_interactions_user_id_interacted_at', 'interactions', ['user_id', 'interacted_at'])
+    op.create_index('ix_interactions_book_id', 'interactions', ['book_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_interactions_book_id', table_name='interactions')
+    op.drop_index('ix_interactions_user_id_interacted_at', table_name='interactions')
+    op.drop_index('ix_recommendations_user_id_algorithm_score', table_name='recommendations')
+    op.drop_index('ix_ratings_book_id', table_name='ratings')
+    op.drop_index('ix_ratings_user_id_book_id', table_name='ratings')
@@ -0,0 +1,60 @@
+"""rating stats
+
+Revision ID: 7c2e91a4b3f0
+Revises: d5117bf2da23
+Create Date: 2026-10-18 10:12:41.204117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '7c2e91a4b3f0'
+down_revision: Union[str, None] = 'd5117bf2da23'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('book_rating_stats',
+    sa.Column('book_id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('rating_count', sa.Integer(), nullable=False),
+    sa.Column('rating_sum', sa.Float(), nullable=False),
+    sa.Column('rating_sum_sq', sa.Float(), nullable=False),
+    sa.Column('last_rated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['book_id'], ['books.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('book_id')
+    )
+    op.create_table('user_rating_stats',
+    sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('rating_count', sa.Integer(), nullable=False),
+    sa.Column('rating_sum', sa.Float(), nullable=False),
+    sa.Column('rating_sum_sq', sa.Float(), nullable=False),
+    sa.Column('last_rated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+    # Backfill from the existing ratings, later changes are applied incrementally
+    op.execute("""
+        INSERT INTO book_rating_stats (book_id, rating_count, rating_sum, rating_sum_sq, last_rated_at)
+        SELECT book_id, COUNT(*), SUM(rating), SUM(rating * rating), MAX(rated_at)
+        FROM ratings GROUP BY book_id
+    """)
+    op.execute("""
+        INSERT INTO user_rating_stats (user_id, rating_count, rating_sum, rating_sum_sq, last_rated_at)
+        SELECT user_id, COUNT(*), SUM(rating), SUM(rating * rating), MAX(rated_at)
+        FROM ratings GROUP BY user_id
+    """)
+    op.execute("""
+        UPDATE books SET average_rating = s.rating_sum / s.rating_count
+        FROM book_rating_stats s WHERE s.book_id = books.id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('user_rating_stats')
+    op.drop_table('book_rating_stats')
@@ -0,0 +1,34 @@
+from fastapi import APIRouter, HTTPException
+
+from app.core.cache import result_cache
+from app.core.interactions import interaction_buffer
+from app.core.registry import registry
+
+router = APIRouter()
+
+
+@router.get("/models")
+async def get_model_version():
+    """Get the active model artifact version"""
+    return {"version": registry.version}
+
+
+@router.post("/models/reload")
+async def reload_models():
+    """Load the current model artifact in the background and swap it in"""
+    previous = registry.version
+    if not await registry.reload():
+        raise HTTPException(status_code=404, detail=f"No compatible model artifact in {registry.artifact_dir}")
+    return {"previous_version": previous, "version": registry.version}
+
+
+@router.get("/cache")
+async def get_cache_stats():
+    """Get recommendation result cache counters"""
+    return result_cache.stats()
+
+
+@router.get("/interactions")
+async def get_interaction_stats():
+    """Get interaction ingestion buffer counters"""
+    return interaction_buffer.stats()
@@ -1,108 +1,204 @@
+import asyncio
+import json
+import logging
 import uuid
+from typing import Optional
 from uuid import UUID
 
+import pandas as pd
 from bson import ObjectId
 from fastapi import APIRouter, HTTPException
-from fastapi.openapi.models import Response
-from sqlalchemy import text
-from sqlalchemy.orm import Session
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.recommender import BookRecommender
+from app.core.registry import registry
 from app.db.postgres.models import Book
-from app.db.postgres.session import get_db
-import pandas as pd
+from app.db.postgres.session import AsyncSessionLocal, get_async_db
 from fastapi.responses import StreamingResponse
 from fastapi import UploadFile, HTTPException
 from fastapi.responses import JSONResponse
-from pymongo import MongoClient
-from bson.binary import Binary
+from fastapi import Header, Depends, Query, Response, status
 import os
 
+from app.db.mongo.files import CHUNK_SIZE, RangeNotSatisfiable, find_pdf, iter_range, parse_range, pdf_bucket
+from app.db.mongo.session import get_mongo_db
 from app.models.schemas import BookUpdate, BookCreate
 
-# MongoDB connection (sync PyMongo)
-MONGO_HOST = "mongo"  # Docker service name
-MONGO_USER = "root"
-MONGO_PASS = "example"
-MONGO_URI = f"mongodb://{MONGO_USER}:{MONGO_PASS}@{MONGO_HOST}:27017"
 
-client = MongoClient(MONGO_URI)
-mongo_db = client["books"]  # Database name
-books_collection = mongo_db["books"]  # Collection name
+def get_pdf_files():
+    """Dependency for the GridFS bucket holding book PDFs"""
+    return pdf_bucket(get_mongo_db())
 
+logger = logging.getLogger(__name__)
 router = APIRouter()
-recommender = BookRecommender()
 
-db = next(get_db())
 
-@router.get("")
-async def get_books():
-    """Get all books info"""
+def book_to_dict(book: Book) -> dict:
+    return {column.name: getattr(book, column.name) for column in Book.__table__.columns}
+
+
+async def refresh_content_index(book: Book):
+    """Add a created or edited book to the served content index off the event loop"""
     try:
-        book_df = pd.read_sql(
-            f"SELECT * FROM books",
-            db.connection()
+        await asyncio.get_running_loop().run_in_executor(
+            None, registry.update_books, pd.DataFrame([book_to_dict(book)])
         )
-        if book_df.empty:
+    except Exception:
+        # The book is stored, it reaches the index with the next training run
+        logger.exception("Content index update for book %s failed", book.id)
+
+
+BOOK_COLUMNS = {column.name: column for column in Book.__table__.columns}
+STREAM_BATCH_SIZE = 1000
+
+
+def book_columns(fields: Optional[str]):
+    """Columns selected by a comma-separated `fields` list, always including id for the cursor"""
+    if not fields:
+        return list(BOOK_COLUMNS.values())
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in BOOK_COLUMNS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return [Book.id] + [BOOK_COLUMNS[name] for name in names if name != "id"]
+
+
+def books_query(columns, after: Optional[UUID]):
+    query = select(*columns).order_by(Book.id)
+    if after is not None:
+        query = query.where(Book.id > after)
+    return query
+
+
+async def iter_books(columns, after: Optional[UUID]):
+    """NDJSON lines of the catalog read through a server-side cursor"""
+    # The request-scoped session is closed before a streamed body is sent
+    async with AsyncSessionLocal() as db:
+        rows = await db.stream(
+            books_query(columns, after).execution_options(yield_per=STREAM_BATCH_SIZE)
+        )
+        async for partition in rows.mappings().partitions():
+            yield "".join(json.dumps(dict(row), default=str) + "\n" for row in partition)
+
+
+@router.get("")
+async def get_books(
+        response: Response,
+        after: Optional[UUID] = None,
+        limit: int = Query(100, ge=1, le=1000),
+        fields: Optional[str] = None,
+        stream: bool = False,
+        db: AsyncSession = Depends(get_async_db)
+):
+    """Get a page of books ordered by id.
+
+    Pass the X-Next-Cursor header of a response as `after` to fetch the
+    next page. `fields` limits the returned columns, and `stream=true`
+    sends every book after the cursor as NDJSON instead of one page.
+    """
+    columns = book_columns(fields)
+    if stream:
+        return StreamingResponse(iter_books(columns, after), media_type="application/x-ndjson")
+    try:
+        books = (await db.execute(books_query(columns, after).limit(limit))).mappings().all()
+        if not books and after is None:
             raise HTTPException(status_code=404, detail="Books not found")
-        book_data = book_df.to_dict(orient="records")
 
-        return book_data
+        if len(books) == limit:
+            response.headers["X-Next-Cursor"] = str(books[-1]["id"])
+        return [dict(book) for book in books]
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Books fetching error: {str(e)}")
 
 @router.get("/{book_id}")
-async def get_book(book_id: UUID):
+async def get_book(book_id: UUID, db: AsyncSession = Depends(get_async_db)):
     """Get book info"""
     try:
-        book_df = pd.read_sql(
-            f"SELECT * FROM books WHERE id = '{book_id}'",
-            db.connection()
-        )
-        if book_df.empty:
+        book = await db.get(Book, book_id)
+        if book is None:
             raise HTTPException(status_code=404, detail="Book not found")
-        book_data = book_df.to_dict(orient="records")[0]
 
-        return book_data
+        return book_to_dict(book)
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Book fetching book: {str(e)}")
 
 
 @router.get("/download-book/{book_id}")
-async def download_book(book_id: UUID):
+async def download_book(
+        book_id: UUID,
+        range_header: Optional[str] = Header(None, alias="Range"),
+        if_none_match: Optional[str] = Header(None),
+        pdf_files=Depends(get_pdf_files)
+):
+    """Stream a book PDF, honouring single byte-range requests"""
     try:
-        book = books_collection.find_one({"book_id": str(book_id)})
-        if not book:
+        grid_out = await find_pdf(pdf_files, book_id)
+        if grid_out is None:
             raise HTTPException(status_code=404, detail="Book not found")
 
+        size = grid_out.length
+        etag = f'"{grid_out._id}"'
+        headers = {
+            "Accept-Ranges": "bytes",
+            "ETag": etag,
+            "Content-Disposition": f"attachment; filename={grid_out.filename}",
+        }
+        if if_none_match == etag:
+            return Response(status_code=304, headers=headers)
+
+        try:
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+        status_code = 200
+        start, end = 0, size - 1
+        if byte_range is not None:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+
         return StreamingResponse(
-            iter([book["pdf_data"]]),  # Binary data
-            media_type=book["content_type"],
-            headers={"Content-Disposition": f"attachment; filename={book['filename']}"}
+            iter_range(grid_out, start, end),
+            status_code=status_code,
+            media_type=(grid_out.metadata or {}).get("content_type", "application/pdf"),
+            headers=headers
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/upload-book/{book_id}")
-async def upload_book(book_id: UUID, file: UploadFile):
+async def upload_book(book_id: UUID, file: UploadFile, pdf_files=Depends(get_pdf_files)):
     if not file.filename.endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
 
     try:
-        # Read the PDF file as bytes
-        pdf_bytes = await file.read()
-
-        # Store in MongoDB as a binary document
-        book_data = {
-            "book_id": str(book_id),
-            "filename": file.filename,
-            "pdf_data": Binary(pdf_bytes),  # Convert to BSON Binary
-            "content_type": "application/pdf"
-        }
-        result = books_collection.insert_one(book_data)
+        # Copy the upload into GridFS chunk by chunk
+        grid_in = pdf_files.open_upload_stream(
+            file.filename,
+            metadata={"book_id": str(book_id), "content_type": "application/pdf"}
+        )
+        try:
+            while chunk := await file.read(CHUNK_SIZE):
+                await grid_in.write(chunk)
+        except Exception:
+            await grid_in.abort()
+            raise
+        await grid_in.close()
+
+        # Drop older versions only once the new file is complete
+        async for previous in pdf_files.find({"metadata.book_id": str(book_id), "_id": {"$ne": grid_in._id}}):
+            await pdf_files.delete(previous._id)
 
         return JSONResponse(
             status_code=200,
@@ -115,7 +211,7 @@ async def upload_book(book_id: UUID, file: UploadFile):
 
 
 @router.post("/", status_code=201)
-async def create_book(book: BookCreate):
+async def create_book(book: BookCreate, db: AsyncSession = Depends(get_async_db)):
     """Create a new book"""
     try:
         # Create ORM model instance
@@ -134,8 +230,9 @@ async def create_book(book: BookCreate):
 
         # Add to session and commit
         db.add(db_book)
-        db.commit()
-        db.refresh(db_book)  # Refresh to get any database defaults
+        await db.commit()
+        await db.refresh(db_book)  # Refresh to get any database defaults
+        await refresh_content_index(db_book)
 
         return {
             "id": str(db_book.id),
@@ -143,22 +240,19 @@ async def create_book(book: BookCreate):
         }
 
     except Exception as e:
-        db.rollback()  # Important for failed transactions
+        await db.rollback()  # Important for failed transactions
         raise HTTPException(
             status_code=400,
             detail=f"Error creating book: {str(e)}"
         )
 
 
-from fastapi import Response, status
-
-
 @router.delete("/{book_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_book(book_id: UUID):
+async def delete_book(book_id: UUID, db: AsyncSession = Depends(get_async_db)):
     """Delete a book by ID"""
     try:
         # Check if book exists and delete in one operation
-        deleted_count = db.query(Book).filter(Book.id == book_id).delete()
+        deleted_count = (await db.execute(delete(Book).where(Book.id == book_id))).rowcount
 
         if not deleted_count:
             raise HTTPException(
@@ -166,11 +260,13 @@ async def delete_book(book_id: UUID):
                 detail="Book not found"
             )
 
-        db.commit()
+        await db.commit()
         return Response(status_code=status.HTTP_204_NO_CONTENT)
 
+    except HTTPException:
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error deleting book: {str(e)}"
@@ -178,11 +274,11 @@ async def delete_book(book_id: UUID):
 
 
 @router.put("/{book_id}")
-async def update_book(book_id: UUID, book: BookUpdate):
+async def update_book(book_id: UUID, book: BookUpdate, db: AsyncSession = Depends(get_async_db)):
     """Update a book by ID"""
     try:
         # Check if book exists
-        db_book = db.query(Book).filter(Book.id == book_id).first()
+        db_book = await db.get(Book, book_id)
         if not db_book:
             raise HTTPException(status_code=404, detail="Book not found")
 
@@ -195,11 +291,14 @@ async def update_book(book_id: UUID, book: BookUpdate):
         for field, value in update_data.items():
             setattr(db_book, field, value)
 
-        db.commit()
-        db.refresh(db_book)
+        await db.commit()
+        await db.refresh(db_book)
+        await refresh_content_index(db_book)
 
-        return db_book
+        return book_to_dict(db_book)
 
+    except HTTPException:
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error updating book: {str(e)}")
@@ -0,0 +1,23 @@
+from fastapi import APIRouter, status
+
+from app.core.interactions import interaction_buffer
+from app.models.schemas import InteractionBatch
+
+router = APIRouter()
+
+
+@router.on_event("startup")
+async def startup_event():
+    interaction_buffer.start()
+
+
+@router.on_event("shutdown")
+async def shutdown_event():
+    await interaction_buffer.stop()
+
+
+@router.post("/", status_code=status.HTTP_202_ACCEPTED)
+async def ingest_interactions(batch: InteractionBatch):
+    """Queue a batch of interaction events, they are written to the database within a flush interval"""
+    accepted = interaction_buffer.add(batch.events)
+    return {"accepted": accepted, "rejected": len(batch.events) - accepted}
@@ -1,20 +1,122 @@
+import logging
 import uuid
 from uuid import UUID
 from datetime import datetime
 
+import pandas as pd
 from fastapi import APIRouter, HTTPException, status, Depends
+from psycopg2 import errorcodes
 from sqlalchemy.orm import Session
-from sqlalchemy import select, update, delete, and_
+from sqlalchemy import select, update, delete, and_, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
 
+from app.core.cache import result_cache
+from app.core.interactions import confidence_weights
+from app.core.registry import registry
 from app.db.postgres.session import get_db
-from app.db.postgres.models import Rating
+from app.db.postgres.models import Book, BookRatingStats, Interaction, Rating, Recommendation, UserRatingStats
 from app.models.schemas import RatingCreate, RatingUpdate
 
+logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Unique index on (user_id, book_id), see the Rating model
+RATING_PAIR_INDEX = "ix_ratings_user_id_book_id"
 
+
+def user_interaction_confidence(db: Session, user_id: UUID) -> pd.DataFrame:
+    """The user's (user_id, book_id, confidence) implicit feedback, aggregated as for training"""
+    rows = db.execute(
+        select(
+            Interaction.user_id, Interaction.book_id, Interaction.interaction_type,
+            func.count().label("events"), func.sum(Interaction.duration).label("duration")
+        )
+        .where(Interaction.user_id == user_id)
+        .group_by(Interaction.user_id, Interaction.book_id, Interaction.interaction_type)
+    ).all()
+    return confidence_weights(pd.DataFrame(
+        rows, columns=["user_id", "book_id", "interaction_type", "events", "duration"]
+    ))
+
+
+def fold_in_user_ratings(db: Session, user_id: UUID):
+    """Drop the user's stale results, then refresh their ALS factors from their ratings and interactions.
+
+    Runs after the rating change is committed, so a failure here is only
+    logged: the change stands. Stale results are dropped first so a failed
+    fold-in still leaves them out; the user is then served from the old
+    factors until the next training run. Results computed on the snapshot
+    before the fold-in are cached under the user's old revision (see
+    BookRecommender.user_cache_version) and never served after it.
+    """
+    try:
+        db.execute(delete(Recommendation).where(Recommendation.user_id == user_id))
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("Dropping precomputed recommendations of user %s failed", user_id)
+    result_cache.invalidate_user(user_id)
+
+    try:
+        if registry.active.model is not None:
+            rows = db.execute(
+                select(Rating.book_id, Rating.rating).where(Rating.user_id == user_id)
+            ).all()
+            book_ids, ratings = [row.book_id for row in rows], [row.rating for row in rows]
+            interactions = user_interaction_confidence(db, user_id)
+            registry.swap(
+                lambda active: (
+                    active.fold_in_user(user_id, book_ids, ratings, interactions)
+                    if active.model is not None else None
+                )
+            )
+    except Exception:
+        db.rollback()
+        logger.exception("Refreshing recommendations of user %s failed", user_id)
+
+
+def apply_rating_change(db: Session, user_id: UUID, book_id: UUID, old_rating=None, new_rating=None):
+    """Apply one rating change to the user and book aggregates inside the caller's transaction.
+
+    Pass only new_rating for a created rating, only old_rating for a deleted
+    one and both for an update. Book.average_rating is kept in step.
+    """
+    old = old_rating or 0.0
+    new = new_rating or 0.0
+    count_delta = (new_rating is not None) - (old_rating is not None)
+    rated_at = func.now() if new_rating is not None else None
+
+    stats = {}
+    for model, key, value in ((UserRatingStats, "user_id", user_id), (BookRatingStats, "book_id", book_id)):
+        statement = insert(model).values({
+            key: value,
+            "rating_count": count_delta,
+            "rating_sum": new - old,
+            "rating_sum_sq": new * new - old * old,
+            "last_rated_at": rated_at,
+        })
+        statement = statement.on_conflict_do_update(
+            index_elements=[key],
+            set_={
+                "rating_count": model.rating_count + statement.excluded.rating_count,
+                "rating_sum": model.rating_sum + statement.excluded.rating_sum,
+                "rating_sum_sq": model.rating_sum_sq + statement.excluded.rating_sum_sq,
+                "last_rated_at": func.coalesce(statement.excluded.last_rated_at, model.last_rated_at),
+            }
+        ).returning(model.rating_count, model.rating_sum)
+        stats[model] = db.execute(statement).one()
+
+    book_stats = stats[BookRatingStats]
+    average = book_stats.rating_sum / book_stats.rating_count if book_stats.rating_count > 0 else 0.0
+    db.execute(update(Book).where(Book.id == book_id).values(average_rating=average))
+
+
+# create_rating, update_rating and delete_rating are plain def so FastAPI runs
+# them in its threadpool: they use a blocking session and the fold-in after
+# the commit waits for the registry lock
 @router.post("/ratings/", status_code=status.HTTP_201_CREATED)
-async def create_rating(rating: RatingCreate, db: Session = Depends(get_db)):
+def create_rating(rating: RatingCreate, db: Session = Depends(get_db)):
     """Create a new rating"""
     try:
         # Check if rating already exists for this user-book pair
@@ -40,13 +142,26 @@ async def create_rating(rating: RatingCreate, db: Session = Depends(get_db)):
         )
 
         db.add(db_rating)
+        apply_rating_change(db, rating.user_id, rating.book_id, new_rating=rating.rating)
         db.commit()
         db.refresh(db_rating)
 
-        return db_rating
-
     except HTTPException:
         raise
+    except IntegrityError as e:
+        db.rollback()
+        if e.orig.diag.constraint_name == RATING_PAIR_INDEX:
+            # A concurrent request created the same pair between the check and the insert
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Rating already exists for this user and book"
+            )
+        if e.orig.pgcode == errorcodes.FOREIGN_KEY_VIOLATION:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User or book not found"
+            )
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(
@@ -54,6 +169,9 @@ async def create_rating(rating: RatingCreate, db: Session = Depends(get_db)):
             detail=f"Error creating rating: {str(e)}"
         )
 
+    fold_in_user_ratings(db, db_rating.user_id)
+    return db_rating
+
 
 @router.get("/ratings/{rating_id}")
 async def get_rating(rating_id: UUID, db: Session = Depends(get_db)):
@@ -113,12 +231,12 @@ async def get_book_ratings(book_id: UUID, db: Session = Depends(get_db)):
 
 
 @router.put("/ratings/{rating_id}")
-async def update_rating(rating_id: UUID, rating_update: RatingUpdate, db: Session = Depends(get_db)):
+def update_rating(rating_id: UUID, rating_update: RatingUpdate, db: Session = Depends(get_db)):
     """Update a rating"""
     try:
-        # Check if rating exists
+        # Check if rating exists, locking it so the aggregates see a consistent old value
         existing_rating = db.execute(
-            select(Rating).where(Rating.id == rating_id)
+            select(Rating).where(Rating.id == rating_id).with_for_update()
         ).scalar_one_or_none()
 
         if not existing_rating:
@@ -127,12 +245,17 @@ async def update_rating(rating_id: UUID, rating_update: RatingUpdate, db: Sessio
                 detail="Rating not found"
             )
 
-        # Update rating
+        # Update rating, the bulk update also refreshes existing_rating
+        old_rating = existing_rating.rating
         db.execute(
             update(Rating)
             .where(Rating.id == rating_id)
             .values(rating=rating_update.rating)
         )
+        apply_rating_change(
+            db, existing_rating.user_id, existing_rating.book_id,
+            old_rating=old_rating, new_rating=rating_update.rating
+        )
         db.commit()
 
         # Return updated rating
@@ -140,8 +263,6 @@ async def update_rating(rating_id: UUID, rating_update: RatingUpdate, db: Sessio
             select(Rating).where(Rating.id == rating_id)
         ).scalar_one()
 
-        return updated_rating
-
     except HTTPException:
         raise
     except Exception as e:
@@ -151,14 +272,17 @@ async def update_rating(rating_id: UUID, rating_update: RatingUpdate, db: Sessio
             detail=f"Error updating rating: {str(e)}"
         )
 
+    fold_in_user_ratings(db, updated_rating.user_id)
+    return updated_rating
+
 
 @router.delete("/ratings/{rating_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_rating(rating_id: UUID, db: Session = Depends(get_db)):
+def delete_rating(rating_id: UUID, db: Session = Depends(get_db)):
     """Delete a rating"""
     try:
-        # Check if rating exists
+        # Check if rating exists, locking it so the aggregates see a consistent old value
         existing_rating = db.execute(
-            select(Rating).where(Rating.id == rating_id)
+            select(Rating).where(Rating.id == rating_id).with_for_update()
         ).scalar_one_or_none()
 
         if not existing_rating:
@@ -168,13 +292,13 @@ async def delete_rating(rating_id: UUID, db: Session = Depends(get_db)):
             )
 
         # Delete rating
+        user_id, book_id, old_rating = existing_rating.user_id, existing_rating.book_id, existing_rating.rating
         db.execute(
             delete(Rating).where(Rating.id == rating_id)
         )
+        apply_rating_change(db, user_id, book_id, old_rating=old_rating)
         db.commit()
 
-        return None
-
     except HTTPException:
         raise
     except Exception as e:
@@ -182,4 +306,6 @@ async def delete_rating(rating_id: UUID, db: Session = Depends(get_db)):
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error deleting rating: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+    fold_in_user_ratings(db, user_id)
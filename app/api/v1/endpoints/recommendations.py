@@ -1,47 +1,169 @@
+import json
+from datetime import datetime, timedelta, timezone
 from uuid import UUID
 
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.cache import result_cache
+from app.core.config import settings
+from app.core.metrics import RECOMMENDATION_SECONDS, span
 from app.core.recommender import BookRecommender
+from app.core.registry import registry
+from app.db.postgres.models import Book, Recommendation
 from app.db.postgres.session import get_db
-import pandas as pd
+from app.models.schemas import BatchRecommendationRequest
 
 router = APIRouter()
-recommender = BookRecommender()
 
 
 @router.on_event("startup")
 async def startup_event():
-    """Load data and train models on startup"""
-    db = next(get_db())
+    """Load the models produced by `python -m app.core.train`"""
+    await registry.reload()
+    if settings.MODEL_WATCH_INTERVAL > 0:
+        registry.start_watching(settings.MODEL_WATCH_INTERVAL)
+
+
+@router.on_event("shutdown")
+async def shutdown_event():
+    registry.stop_watching()
+
+
+def get_recommender() -> BookRecommender:
+    """The active model snapshot"""
+    recommender = registry.active
+    if recommender.artifact_version is None:
+        raise HTTPException(
+            status_code=503,
+            detail=f"No model artifacts in {settings.MODEL_ARTIFACT_DIR}, run `python -m app.core.train`"
+        )
+    return recommender
+
+
+def get_precomputed(db: Session, user_id: UUID, algorithm: str, limit: int):
+    """Rows written by `python -m app.core.precompute`, or None without a fresh, complete set"""
+    if settings.PRECOMPUTED_MAX_AGE <= 0:
+        return None
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.PRECOMPUTED_MAX_AGE)
+    rows = db.execute(
+        select(Recommendation.book_id, Recommendation.score, Book.title, Book.author)
+        .join(Book, Book.id == Recommendation.book_id)
+        .where(
+            Recommendation.user_id == user_id,
+            Recommendation.algorithm == algorithm,
+            Recommendation.generated_at >= cutoff
+        )
+        .order_by(Recommendation.score.desc())
+        .limit(limit)
+    ).all()
+    if len(rows) < limit:
+        return None
+    return rows
+
 
-    # Load ratings
-    ratings = pd.read_sql("SELECT user_id, book_id, rating FROM ratings", db.connection())
+def hybrid_or_precomputed(recommender: BookRecommender, db: Session, user_id: UUID, limit: int):
+    rows = get_precomputed(db, user_id, "hybrid", limit)
+    if rows is None:
+        return recommender.hybrid_recommend(user_id, top_n=limit)
+    return [{
+        'book_id': row.book_id,
+        'score': row.score,
+        'title': row.title,
+        'author': row.author
+    } for row in rows]
 
-    # Load books
-    books = pd.read_sql("""
-        SELECT id, title, author, genres 
-        FROM books
-    """, db.connection())
 
-    recommender.load_data(ratings, books)
-    recommender.train_collaborative()
-    recommender.train_content_based()
-    recommender.train_als()
+def als_or_precomputed(recommender: BookRecommender, db: Session, user_id: UUID, limit: int):
+    rows = get_precomputed(db, user_id, "als", limit)
+    if rows is None:
+        return recommender.als_recommend(user_id, limit)
+    return [row.book_id for row in rows]
 
 
+def json_response(content) -> JSONResponse:
+    """Serialize a result inside the `serialize` span instead of after the endpoint returns"""
+    with span("serialize"):
+        return JSONResponse(jsonable_encoder(content))
+
+
+# get_recommendations and get_als are plain def so FastAPI runs them in its
+# threadpool, the precomputed lookup uses a blocking session
 @router.get("/recommend/{user_id}")
-async def get_recommendations(user_id: UUID, limit: int = 5):
+def get_recommendations(user_id: UUID, limit: int = 5, db: Session = Depends(get_db)):
     """Get personalized recommendations"""
-    return recommender.hybrid_recommend(user_id, top_n=limit)
+    recommender = get_recommender()
+    with span("recommend", RECOMMENDATION_SECONDS, ("hybrid",)):
+        result = result_cache.get_or_compute(
+            "recommend", user_id, limit, recommender.user_cache_version(user_id),
+            lambda: hybrid_or_precomputed(recommender, db, user_id, limit),
+            user_id=user_id
+        )
+    return json_response(result)
 
 
 @router.get("/similar/{book_id}")
 async def get_similar(book_id: UUID, limit: int = 5):
     """Get similar books"""
-    return recommender.get_similar_books(book_id, top_n=limit)
+    recommender = get_recommender()
+    with span("recommend", RECOMMENDATION_SECONDS, ("similar",)):
+        result = result_cache.get_or_compute(
+            "similar", book_id, limit, recommender.cache_version,
+            lambda: recommender.get_similar_books(book_id, top_n=limit)
+        )
+    return json_response(result)
 
 
 @router.get("/als/{user_id}")
-async def get_als(user_id: UUID, limit: int = 5):
+def get_als(user_id: UUID, limit: int = 5, db: Session = Depends(get_db)):
     """Get ALS recommendations"""
-    return recommender.als_recommend(user_id, limit)
+    recommender = get_recommender()
+    with span("recommend", RECOMMENDATION_SECONDS, ("als",)):
+        result = result_cache.get_or_compute(
+            "als", user_id, limit, recommender.user_cache_version(user_id),
+            lambda: als_or_precomputed(recommender, db, user_id, limit),
+            user_id=user_id
+        )
+    return json_response(result)
+
+
+def iter_batch(recommender: BookRecommender, request: BatchRecommendationRequest):
+    """NDJSON lines of recommendations, scored chunk by chunk"""
+    chunk_size = settings.BATCH_CHUNK_SIZE
+    if request.algorithm == "hybrid":
+        # Hybrid scoring holds a dense users x books block, keep it bounded
+        chunk_size = max(1, min(chunk_size, 2 ** 24 // max(len(recommender.book_index), 1)))
+    for start in range(0, len(request.user_ids), chunk_size):
+        chunk = request.user_ids[start:start + chunk_size]
+        with span("recommend", RECOMMENDATION_SECONDS, (f"batch_{request.algorithm}",)):
+            if request.algorithm == "als":
+                codes = recommender.user_mapping.encode(chunk)
+                known = [user_id for user_id, code in zip(chunk, codes) if code >= 0]
+                indices, scores = recommender.als_recommend_batch(known, request.limit) if known else ([], [])
+                encoder = recommender.item_mapping
+            else:
+                known = chunk
+                indices, scores = recommender.hybrid_recommend_batch(chunk, request.limit)
+                encoder = recommender.book_index
+
+        results = dict(zip(known, zip(indices, scores)))
+        for user_id in chunk:
+            if user_id not in results:
+                line = {"user_id": user_id, "error": "User not found in training data"}
+            else:
+                user_indices, user_scores = results[user_id]
+                filled = user_indices >= 0
+                line = {"user_id": user_id, "recommendations": [
+                    {"book_id": book_id, "score": float(score)}
+                    for book_id, score in zip(encoder.decode(user_indices[filled]), user_scores[filled])
+                ]}
+            yield json.dumps(line, default=str) + "\n"
+
+
+@router.post("/batch")
+async def batch_recommendations(request: BatchRecommendationRequest):
+    """Stream recommendations for many users as NDJSON, one line per user"""
+    return StreamingResponse(iter_batch(get_recommender(), request), media_type="application/x-ndjson")
@@ -1,83 +1,83 @@
 from uuid import UUID
 
-from fastapi import APIRouter, HTTPException
-from app.core.recommender import BookRecommender
-from app.db.postgres.session import get_db
-import pandas as pd
+from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.postgres.models import BookRatingStats, UserRatingStats
+from app.db.postgres.session import get_async_db
 
 router = APIRouter()
-recommender = BookRecommender()
 
-db = next(get_db())
+
+def rating_summary(stats) -> dict:
+    """Average and count from an aggregate row maintained by the ratings endpoints"""
+    return {"avg": stats.rating_sum / stats.rating_count, "count": stats.rating_count}
 
 
 @router.get("/avg-user-rating/{user_id}")
-async def get_user(user_id: UUID):
+async def get_user(user_id: UUID, db: AsyncSession = Depends(get_async_db)):
     """Get user info"""
     try:
-        user_df = pd.read_sql(
-            f"SELECT AVG(rating) FROM ratings WHERE user_id = '{user_id}' GROUP BY user_id",
-            db.connection()
-        )
-        if user_df.empty:
+        stats = await db.get(UserRatingStats, user_id)
+        if stats is None or stats.rating_count <= 0:
             raise HTTPException(status_code=404, detail="User not found")
-        user_data = user_df.to_dict(orient="records")[0]
 
-        return user_data
+        return rating_summary(stats)
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching avg user rating: {str(e)}")
 
 
 @router.get("/avg-users-rating")
-async def get_users():
+async def get_users(db: AsyncSession = Depends(get_async_db)):
     """Get user info"""
     try:
-        user_df = pd.read_sql(
-            f"SELECT AVG(rating), user_id FROM ratings GROUP BY user_id",
-            db.connection()
-        )
-        if user_df.empty:
+        rows = (await db.execute(
+            select(UserRatingStats).where(UserRatingStats.rating_count > 0)
+        )).scalars().all()
+        if not rows:
             raise HTTPException(status_code=404, detail="User not found")
-        user_data = user_df.to_dict(orient="records")
 
-        return user_data
+        return [{**rating_summary(row), "user_id": row.user_id} for row in rows]
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching avg user rating: {str(e)}")
 
 
 @router.get("/avg-book-rating/{book_id}")
-async def get_book(book_id: UUID):
+async def get_book(book_id: UUID, db: AsyncSession = Depends(get_async_db)):
     """Get user info"""
     try:
-        book_df = pd.read_sql(
-            f"SELECT AVG(rating) FROM ratings WHERE book_id = '{book_id}' GROUP BY book_id",
-            db.connection()
-        )
-        if book_df.empty:
+        stats = await db.get(BookRatingStats, book_id)
+        if stats is None or stats.rating_count <= 0:
             raise HTTPException(status_code=404, detail="Book not found")
-        book_data = book_df.to_dict(orient="records")[0]
 
-        return book_data
+        return rating_summary(stats)
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching avg book rating: {str(e)}")
 
 
 @router.get("/avg-books-rating")
-async def get_books():
+async def get_books(db: AsyncSession = Depends(get_async_db)):
     """Get user info"""
     try:
-        user_df = pd.read_sql(
-            f"SELECT AVG(rating), book_id FROM ratings GROUP BY book_id",
-            db.connection()
-        )
-        if user_df.empty:
+        rows = (await db.execute(
+            select(BookRatingStats).where(BookRatingStats.rating_count > 0)
+        )).scalars().all()
+        if not rows:
             raise HTTPException(status_code=404, detail="Books not found")
-        user_data = user_df.to_dict(orient="records")
 
-        return user_data
+        return [{**rating_summary(row), "book_id": row.book_id} for row in rows]
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching avg user rating: {str(e)}")
@@ -1,29 +1,25 @@
 from uuid import UUID
 
-from fastapi import APIRouter, HTTPException
-from app.core.recommender import BookRecommender
-from app.db.postgres.session import get_db
-import pandas as pd
+from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
 
-router = APIRouter()
-recommender = BookRecommender()
+from app.db.postgres.models import User
+from app.db.postgres.session import get_async_db
 
-db = next(get_db())
+router = APIRouter()
 
 
 @router.get("/{user_id}")
-async def get_user(user_id: UUID):
+async def get_user(user_id: UUID, db: AsyncSession = Depends(get_async_db)):
     """Get user info"""
     try:
-        user_df = pd.read_sql(
-            f"SELECT * FROM users WHERE id = '{user_id}'",
-            db.connection()
-        )
-        if user_df.empty:
+        user = await db.get(User, user_id)
+        if user is None:
             raise HTTPException(status_code=404, detail="User not found")
-        user_data = user_df.to_dict(orient="records")[0]
 
-        return user_data
+        return {column.name: getattr(user, column.name) for column in User.__table__.columns}
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching user: {str(e)}")
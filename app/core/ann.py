@@ -0,0 +1,106 @@
+import numpy as np
+
+from app.core.scoring import top_n_indices
+
+
+class IVFIndex:
+    """Inverted-file index for maximum inner product search.
+
+    Vectors are clustered with k-means into `n_lists` lists; a query only
+    scores the vectors of the `n_probe` lists whose centroids have the
+    highest inner product with it. Raising `n_probe` trades latency for
+    recall, `n_probe == n_lists` is an exact search.
+    """
+
+    def __init__(self, n_lists: int = None, n_probe: int = 8, iterations: int = 10,
+                 max_training_points: int = 256, seed: int = 42):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.iterations = iterations
+        self.max_training_points = max_training_points
+        self.seed = seed
+        self.centroids = None
+        self.vectors = None
+        self.ids = None
+        self.offsets = None
+
+    def fit(self, vectors: np.ndarray) -> "IVFIndex":
+        """Cluster the vectors and lay them out contiguously per list"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        n_lists = self.n_lists or max(1, int(np.sqrt(len(vectors))))
+        n_lists = min(n_lists, len(vectors))
+        rng = np.random.default_rng(self.seed)
+
+        # k-means on a sample bounded to max_training_points per list
+        sample_size = min(len(vectors), n_lists * self.max_training_points)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+        for _ in range(self.iterations):
+            assignment = _nearest_centroid(sample, centroids)
+            counts = np.bincount(assignment, minlength=n_lists)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+
+        assignment = _nearest_centroid(vectors, centroids)
+        order = np.argsort(assignment, kind='stable')
+        self.centroids = centroids
+        self.vectors = vectors[order]
+        self.ids = order.astype(np.int64)
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(assignment, minlength=n_lists))))
+        self.n_lists = n_lists
+        return self
+
+    def to_arrays(self):
+        return {
+            'centroids': self.centroids,
+            'vectors': self.vectors,
+            'ids': self.ids,
+            'offsets': self.offsets,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays, n_probe: int = 8) -> "IVFIndex":
+        """Rebuild a fitted index from the arrays returned by to_arrays()"""
+        index = cls(n_lists=len(arrays['centroids']), n_probe=n_probe)
+        index.centroids = arrays['centroids']
+        index.vectors = arrays['vectors']
+        index.ids = arrays['ids']
+        index.offsets = arrays['offsets']
+        return index
+
+    def search(self, query: np.ndarray, n: int, exclude=None, n_probe: int = None):
+        """Approximate top-n (ids, scores) by inner product, skipping `exclude` ids"""
+        n_probe = n_probe or self.n_probe
+        query = np.asarray(query, dtype=np.float32)
+        excluded = 0 if exclude is None else len(exclude)
+
+        # Probe the best non-empty lists, extending past n_probe until
+        # enough candidates remain after filtering
+        ranked = np.argsort(-(self.centroids @ query))
+        sizes = np.diff(self.offsets)[ranked]
+        ranked, sizes = ranked[sizes > 0], sizes[sizes > 0]
+        enough = np.flatnonzero(np.cumsum(sizes) >= n + excluded)
+        n_probed = max(n_probe, enough[0] + 1 if len(enough) else len(ranked))
+        candidates = np.concatenate([
+            np.arange(self.offsets[lst], self.offsets[lst + 1]) for lst in ranked[:n_probed]
+        ])
+        ids = self.ids[candidates]
+        scores = self.vectors[candidates] @ query
+        if excluded:
+            keep = ~np.isin(ids, exclude)
+            ids, scores = ids[keep], scores[keep]
+        top = top_n_indices(scores, n)
+        return ids[top], scores[top]
+
+
+def _nearest_centroid(vectors: np.ndarray, centroids: np.ndarray, block_size: int = 65536) -> np.ndarray:
+    """Index of the closest centroid (euclidean) of every vector, computed in blocks"""
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    assignment = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), block_size):
+        block = vectors[start:start + block_size]
+        distances = centroid_norms - 2 * block @ centroids.T
+        assignment[start:start + block_size] = distances.argmin(axis=1)
+    return assignment
@@ -0,0 +1,93 @@
+import json
+import os
+import shutil
+import time
+from typing import Dict, Optional
+from uuid import uuid4
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+# Bump whenever the set or layout of saved arrays changes; older
+# artifacts are then ignored and the models are retrained.
+FORMAT_VERSION = 3
+
+CURRENT_FILE = 'CURRENT'
+MANIFEST_FILE = 'manifest.json'
+
+
+def sparse_to_arrays(name: str, matrix: csr_matrix) -> Dict[str, np.ndarray]:
+    return {
+        f'{name}.data': matrix.data,
+        f'{name}.indices': matrix.indices,
+        f'{name}.indptr': matrix.indptr,
+        f'{name}.shape': np.array(matrix.shape, dtype=np.int64),
+    }
+
+
+def arrays_to_sparse(name: str, arrays: Dict[str, np.ndarray]) -> csr_matrix:
+    return csr_matrix(
+        (arrays[f'{name}.data'], arrays[f'{name}.indices'], arrays[f'{name}.indptr']),
+        shape=tuple(int(dim) for dim in arrays[f'{name}.shape']),
+        copy=False
+    )
+
+
+def save_version(root: str, arrays: Dict[str, np.ndarray], manifest: Dict) -> str:
+    """Write arrays as .npy files into a new version directory and make it current.
+
+    The version is written under a temporary name and renamed into place,
+    then CURRENT is replaced atomically, so readers never see a partial
+    artifact.
+    """
+    os.makedirs(root, exist_ok=True)
+    version = time.strftime('%Y%m%dT%H%M%S') + f'-{uuid4().hex[:8]}'
+    staging = os.path.join(root, f'.{version}.tmp')
+    os.makedirs(staging)
+    try:
+        for name, array in arrays.items():
+            np.save(os.path.join(staging, f'{name}.npy'), np.ascontiguousarray(array), allow_pickle=False)
+        manifest = {
+            **manifest,
+            'format_version': FORMAT_VERSION,
+            'version': version,
+            'created_at': time.time(),
+            'arrays': sorted(arrays),
+        }
+        with open(os.path.join(staging, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.rename(staging, os.path.join(root, version))
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    pointer = os.path.join(root, f'.{CURRENT_FILE}.{os.getpid()}.tmp')
+    with open(pointer, 'w') as f:
+        f.write(version)
+    os.replace(pointer, os.path.join(root, CURRENT_FILE))
+    return os.path.join(root, version)
+
+
+def current_version(root: str) -> Optional[str]:
+    """Path of the current compatible version, or None"""
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as f:
+            path = os.path.join(root, f.read().strip())
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('format_version') != FORMAT_VERSION:
+        return None
+    return path
+
+
+def load_version(path: str):
+    """Manifest and memory-mapped arrays of a version directory"""
+    with open(os.path.join(path, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    arrays = {
+        name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r', allow_pickle=False)
+        for name in manifest['arrays']
+    }
+    return manifest, arrays
@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional
+
+from app.core.config import settings
+
+MISSING = object()
+
+
+class CacheBackend:
+    """Interface for result cache storage; swap in e.g. a Redis-backed one"""
+
+    def get(self, key: Hashable) -> Any:
+        """Cached value or MISSING"""
+        raise NotImplementedError
+
+    def set(self, key: Hashable, value: Any, tags: Iterable[Hashable] = ()):
+        raise NotImplementedError
+
+    def invalidate_tag(self, tag: Hashable) -> int:
+        """Drop every entry stored with this tag, returns how many were dropped"""
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, int]:
+        raise NotImplementedError
+
+
+class LRUCache(CacheBackend):
+    """In-process LRU cache with a per-entry time-to-live"""
+
+    def __init__(self, max_entries: int = 10000, ttl: Optional[float] = 600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (expires_at, value, tags), least recently used first
+        self._entries: OrderedDict = OrderedDict()
+        self._tagged = defaultdict(set)
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, tags=()):
+        if self.max_entries <= 0:
+            return
+        tags = tuple(tags)
+        expires_at = time.monotonic() + self.ttl if self.ttl else float('inf')
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, value, tags)
+            for tag in tags:
+                self._tagged[tag].add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_tag(self, tag):
+        with self._lock:
+            keys = self._tagged.pop(tag, ())
+            for key in list(keys):
+                self._remove(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def _remove(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tagged[tag]
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+
+class RecommendationCache:
+    """Recommendation results keyed by (endpoint, id, limit, model version)"""
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+
+    def get_or_compute(self, endpoint: str, item_id, limit: int, version: Optional[str],
+                       compute: Callable[[], Any], user_id=None):
+        key = (endpoint, item_id, limit, version)
+        value = self.backend.get(key)
+        if value is MISSING:
+            value = compute()
+            self.backend.set(key, value, tags=() if user_id is None else (('user', user_id),))
+        return value
+
+    def invalidate_user(self, user_id) -> int:
+        """Drop every cached result computed for the user"""
+        return self.backend.invalidate_tag(('user', user_id))
+
+    def stats(self) -> Dict[str, int]:
+        return self.backend.stats()
+
+
+result_cache = RecommendationCache(
+    LRUCache(max_entries=settings.RESULT_CACHE_SIZE, ttl=settings.RESULT_CACHE_TTL)
+)
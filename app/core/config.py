@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic_settings import BaseSettings
 
 
@@ -9,6 +11,33 @@ class Settings(BaseSettings):
     DB_USER: str = "postgres"
     DB_PASSWORD: str = "postgres"
     DB_NAME: str = "bookdb"
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30  # seconds a request waits for a free connection
+    MONGO_HOST: str = "mongo"
+    MONGO_PORT: str = "27017"
+    MONGO_USER: str = "root"
+    MONGO_PASSWORD: str = "example"
+    MONGO_DB: str = "books"
+    MONGO_MAX_POOL_SIZE: int = 100
+    MONGO_MIN_POOL_SIZE: int = 0
+    MODEL_ARTIFACT_DIR: str = "artifacts"
+    MODEL_WATCH_INTERVAL: float = 0  # seconds between artifact checks, 0 disables the watcher
+    PRECOMPUTED_MAX_AGE: float = 86400  # seconds precomputed rows are served, 0 disables them
+    BATCH_CHUNK_SIZE: int = 1024  # users scored per matrix product by /recommendations/batch
+    RESULT_CACHE_SIZE: int = 10000  # 0 disables the recommendation result cache
+    RESULT_CACHE_TTL: float = 600
+    INTERACTION_FLUSH_ROWS: int = 5000  # buffered interaction events that trigger a flush
+    INTERACTION_FLUSH_INTERVAL: float = 1.0  # seconds between flushes of a partly filled buffer
+    CONTENT_HASHING: bool = False  # hash terms instead of learning a vocabulary, keeps new terms of new books
+    CONTENT_HASH_FEATURES: int = 2 ** 18
+    ALS_ANN_INDEX: bool = False
+    ALS_ANN_N_LISTS: Optional[int] = None
+    ALS_ANN_N_PROBE: int = 8
+    ALS_QUANTIZED: bool = False  # serve ALS from int8 item factors with full-precision rescoring
+    ALS_QUANTIZED_OVERSAMPLE: int = 4  # candidates rescored per requested recommendation
+    PROFILE_DIR: Optional[str] = None  # where requests with an X-Profile header dump folded stacks, None disables
+    PROFILE_INTERVAL: float = 0.005  # seconds between profiler samples
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,79 @@
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer, TfidfVectorizer
+
+
+def book_text(books: pd.DataFrame) -> pd.Series:
+    """Title, author, genres and description of every book as one document"""
+    genres = books['genres'].apply(lambda x: ' '.join(x) if x is not None else '')
+    text = books['title'].fillna('') + ' ' + books['author'].fillna('') + ' ' + genres
+    if 'description' in books:
+        text = text + ' ' + books['description'].fillna('')
+    return text
+
+
+class ContentFeatures:
+    """TF-IDF features of book text that stay fixed after fit.
+
+    With hashing=False terms are looked up in the vocabulary learned by fit,
+    so terms first seen in later books are ignored. With hashing=True terms
+    are hashed into n_features columns, new terms still count and only the
+    IDF weights are learned; hashed columns of terms unseen during fit get
+    the highest IDF. Either way transform() of new or edited books gives
+    rows comparable with the fitted matrix without refitting.
+    """
+
+    def __init__(self, hashing: bool = False, n_features: int = 2 ** 18):
+        self.hashing = hashing
+        self.n_features = n_features
+        self.vectorizer = None
+        self.transformer = None
+
+    def fit_transform(self, texts) -> csr_matrix:
+        if self.hashing:
+            self.vectorizer = self._hashing_vectorizer()
+            self.transformer = TfidfTransformer()
+            return self.transformer.fit_transform(self.vectorizer.transform(texts)).astype(np.float32)
+        self.vectorizer = TfidfVectorizer(stop_words='english', dtype=np.float32)
+        return self.vectorizer.fit_transform(texts)
+
+    def transform(self, texts) -> csr_matrix:
+        if self.hashing:
+            return self.transformer.transform(self.vectorizer.transform(texts)).astype(np.float32)
+        return self.vectorizer.transform(texts)
+
+    def _hashing_vectorizer(self) -> HashingVectorizer:
+        return HashingVectorizer(stop_words='english', n_features=self.n_features, alternate_sign=False, norm=None)
+
+    @property
+    def idf(self) -> np.ndarray:
+        return (self.transformer if self.hashing else self.vectorizer).idf_
+
+    def params(self) -> Dict:
+        return {'hashing': self.hashing, 'n_features': self.n_features}
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        arrays = {'idf': self.idf}
+        if not self.hashing:
+            vocabulary = self.vectorizer.vocabulary_
+            arrays['terms'] = np.array(sorted(vocabulary, key=vocabulary.get), dtype=str)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays, hashing: bool = False, n_features: int = 2 ** 18) -> 'ContentFeatures':
+        """Rebuild fitted features from the arrays returned by to_arrays()"""
+        features = cls(hashing=hashing, n_features=n_features)
+        idf = np.asarray(arrays['idf'])
+        if hashing:
+            features.vectorizer = features._hashing_vectorizer()
+            features.transformer = TfidfTransformer()
+            features.transformer.idf_ = idf
+        else:
+            features.vectorizer = TfidfVectorizer(
+                stop_words='english', dtype=np.float32, vocabulary=arrays['terms'].tolist()
+            )
+            features.vectorizer.idf_ = idf
+        return features
@@ -0,0 +1,122 @@
+from typing import Dict, Iterable, Iterator, List, Optional
+from uuid import UUID
+
+import numpy as np
+
+
+def uuid_keys(ids) -> np.ndarray:
+    """UUIDs as an (n,) array of 16-byte keys; accepts UUIDs, S16 keys or an (n, 16) uint8 array"""
+    if isinstance(ids, np.ndarray) and ids.dtype == np.dtype('S16'):
+        return ids
+    if isinstance(ids, np.ndarray) and ids.dtype == np.uint8:
+        return np.ascontiguousarray(ids).reshape(-1, 16).view('S16').ravel()
+    packed = b''.join(uid.bytes for uid in ids)
+    return np.frombuffer(packed, dtype='S16')
+
+
+def keys_to_uuids(keys: np.ndarray) -> List[UUID]:
+    # Indexing an S16 array strips trailing zero bytes, slice the raw buffer instead
+    packed = np.ascontiguousarray(keys).tobytes()
+    return [UUID(bytes=packed[start:start + 16]) for start in range(0, len(packed), 16)]
+
+
+class IdEncoder:
+    """UUID <-> dense integer code mapping shared by the models.
+
+    Keys are kept as a sorted array of 16-byte values with the code of each
+    key alongside, so a lookup is a vectorized searchsorted and an id costs
+    24 bytes instead of two dict entries of Python objects. Ids added after
+    construction (fold-in of new users or books) live in a small overflow
+    dict until the encoder is rebuilt. Encoders are never modified in place,
+    `extended` returns a new one, so models can share them safely.
+    """
+
+    def __init__(self, sorted_keys: np.ndarray, sorted_codes: np.ndarray):
+        self.sorted_keys = sorted_keys
+        self.sorted_codes = sorted_codes
+        # Position in sorted_keys of every code, for decoding
+        self.rank = np.empty(len(sorted_codes), dtype=sorted_codes.dtype)
+        self.rank[sorted_codes] = np.arange(len(sorted_codes), dtype=sorted_codes.dtype)
+        self._extra: Dict[UUID, int] = {}
+        self._extra_ids: List[UUID] = []
+
+    @classmethod
+    def from_ids(cls, ids) -> 'IdEncoder':
+        """Encoder assigning codes 0..n-1 in the order of ids, which must be unique"""
+        keys = uuid_keys(ids)
+        code_dtype = np.int32 if len(keys) < 2 ** 31 else np.int64
+        order = np.argsort(keys, kind='stable').astype(code_dtype)
+        return cls(keys[order], order)
+
+    def __len__(self) -> int:
+        return len(self.sorted_keys) + len(self._extra_ids)
+
+    def __iter__(self) -> Iterator[UUID]:
+        yield from keys_to_uuids(self.sorted_keys[self.rank])
+        yield from self._extra_ids
+
+    def __contains__(self, uid) -> bool:
+        return self.get(uid) is not None
+
+    def __getitem__(self, uid: UUID) -> int:
+        code = self.get(uid)
+        if code is None:
+            raise KeyError(uid)
+        return code
+
+    def get(self, uid: UUID, default=None) -> Optional[int]:
+        code = int(self.encode([uid])[0])
+        return default if code < 0 else code
+
+    def encode(self, ids) -> np.ndarray:
+        """Codes of many ids at once, -1 for unknown ones"""
+        keys = uuid_keys(ids)
+        codes = np.full(len(keys), -1, dtype=np.int64)
+        if len(self.sorted_keys):
+            pos = np.searchsorted(self.sorted_keys, keys)
+            pos[pos == len(self.sorted_keys)] = 0
+            found = self.sorted_keys[pos] == keys
+            codes[found] = self.sorted_codes[pos[found]]
+        if self._extra:
+            for i in np.flatnonzero(codes < 0):
+                codes[i] = self._extra.get(UUID(bytes=keys[i:i + 1].tobytes()), -1)
+        return codes
+
+    def decode(self, codes) -> np.ndarray:
+        """Object array of the UUIDs with the given codes"""
+        codes = np.asarray(codes, dtype=np.int64)
+        base = codes < len(self.sorted_keys)
+        decoded = np.empty(len(codes), dtype=object)
+        decoded[base] = keys_to_uuids(self.sorted_keys[self.rank[codes[base]]])
+        for i in np.flatnonzero(~base):
+            decoded[i] = self._extra_ids[codes[i] - len(self.sorted_keys)]
+        return decoded
+
+    def extended(self, ids: Iterable[UUID]) -> 'IdEncoder':
+        """Copy of the encoder with unknown ids appended as new codes"""
+        encoder = IdEncoder.__new__(IdEncoder)
+        encoder.sorted_keys, encoder.sorted_codes, encoder.rank = self.sorted_keys, self.sorted_codes, self.rank
+        encoder._extra = dict(self._extra)
+        encoder._extra_ids = list(self._extra_ids)
+        for uid in ids:
+            if uid not in encoder:
+                encoder._extra[uid] = len(encoder)
+                encoder._extra_ids.append(uid)
+        return encoder
+
+    @property
+    def nbytes(self) -> int:
+        return self.sorted_keys.nbytes + self.sorted_codes.nbytes + self.rank.nbytes
+
+    def to_arrays(self, name: str) -> Dict[str, np.ndarray]:
+        if self._extra_ids:
+            keys = np.concatenate((self.sorted_keys[self.rank], uuid_keys(self._extra_ids)))
+            return IdEncoder.from_ids(keys).to_arrays(name)
+        return {
+            f'{name}.keys': self.sorted_keys.view(np.uint8).reshape(-1, 16),
+            f'{name}.codes': self.sorted_codes,
+        }
+
+    @classmethod
+    def from_arrays(cls, name: str, arrays: Dict[str, np.ndarray]) -> 'IdEncoder':
+        return cls(uuid_keys(arrays[f'{name}.keys']), arrays[f'{name}.codes'])
@@ -0,0 +1,178 @@
+"""Buffered ingestion of implicit-feedback events and their conversion into ALS confidence.
+
+Events are kept in memory and written with one COPY per flush, either when
+INTERACTION_FLUSH_ROWS events are waiting or every INTERACTION_FLUSH_INTERVAL
+seconds. Events still buffered when a worker dies are lost, which is
+acceptable for implicit feedback.
+"""
+import asyncio
+import csv
+import io
+import logging
+import threading
+import uuid
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+import pandas as pd
+
+from app.core.config import settings
+from app.db.postgres.session import engine
+
+logger = logging.getLogger(__name__)
+
+# Confidence added per event of each type, before log damping
+INTERACTION_WEIGHTS = {"view": 1.0, "click": 2.0, "purchase": 8.0}
+# Confidence added per log-minute of reading time
+DURATION_WEIGHT = 0.5
+
+COLUMNS = ("id", "user_id", "book_id", "interaction_type", "interacted_at", "duration")
+
+
+def copy_interactions(rows) -> int:
+    """Write (user_id, book_id, type, interacted_at, duration) rows with COPY, returns rows stored.
+
+    Rows go through a temporary staging table so events for unknown users
+    or books are dropped instead of failing the whole batch.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for user_id, book_id, interaction_type, interacted_at, duration in rows:
+        writer.writerow((uuid.uuid4(), user_id, book_id, interaction_type,
+                         "" if interacted_at is None else interacted_at.isoformat(),
+                         "" if duration is None else duration))
+    buffer.seek(0)
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(
+            "CREATE TEMP TABLE interactions_staging "
+            "(LIKE interactions INCLUDING DEFAULTS) ON COMMIT DROP"
+        )
+        cursor.copy_expert(
+            f"COPY interactions_staging ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+        cursor.execute(
+            f"INSERT INTO interactions ({', '.join(COLUMNS)}) "
+            "SELECT s.id, s.user_id, s.book_id, s.interaction_type, COALESCE(s.interacted_at, now()), s.duration "
+            "FROM interactions_staging s "
+            "JOIN users u ON u.id = s.user_id JOIN books b ON b.id = s.book_id"
+        )
+        stored = cursor.rowcount
+        connection.commit()
+        return stored
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+
+class InteractionBuffer:
+    """In-memory batch of interaction events flushed to Postgres on a size or time threshold"""
+
+    def __init__(self, flush_rows: int, flush_interval: float, max_pending: Optional[int] = None):
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        # Cap on events kept while the database is unreachable
+        self.max_pending = max_pending or 20 * flush_rows
+        self._pending: List[tuple] = []
+        self._lock = threading.Lock()
+        self._flush_lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+        # The loop only keeps weak references to tasks, hold size-triggered flushes until done
+        self._flush_tasks: Set[asyncio.Task] = set()
+        self.received = self.stored = self.dropped = self.flushes = 0
+
+    def add(self, events) -> int:
+        """Queue events, returns how many were accepted"""
+        rows = [
+            (event.user_id, event.book_id, event.interaction_type, event.interacted_at, event.duration)
+            for event in events
+        ]
+        with self._lock:
+            room = max(self.max_pending - len(self._pending), 0)
+            self._pending.extend(rows[:room])
+            self.received += len(rows)
+            self.dropped += len(rows) - min(room, len(rows))
+            full = len(self._pending) >= self.flush_rows
+        if full:
+            task = asyncio.get_running_loop().create_task(self.flush())
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+        return min(room, len(rows))
+
+    async def flush(self) -> int:
+        """Write every pending event off the event loop, returns rows stored"""
+        async with self._flush_lock:
+            with self._lock:
+                rows, self._pending = self._pending, []
+            if not rows:
+                return 0
+            try:
+                stored = await asyncio.get_running_loop().run_in_executor(None, copy_interactions, rows)
+            except Exception:
+                # Keep the events for the next flush, newest ones are dropped if over the cap
+                with self._lock:
+                    pending = rows + self._pending
+                    self._pending = pending[:self.max_pending]
+                    self.dropped += len(pending) - len(self._pending)
+                logger.exception("Interaction flush of %d events failed", len(rows))
+                return 0
+            self.flushes += 1
+            self.stored += stored
+            self.dropped += len(rows) - stored
+            return stored
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        if self._flusher is None:
+            self._flusher = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop the periodic flush and write what is left"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks)
+        await self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'pending': len(self._pending),
+            'received': self.received,
+            'stored': self.stored,
+            'dropped': self.dropped,
+            'flushes': self.flushes,
+        }
+
+
+def confidence_weights(aggregated: pd.DataFrame) -> pd.DataFrame:
+    """ALS confidence per (user_id, book_id) from per-type interaction aggregates.
+
+    `aggregated` has one row per (user_id, book_id, interaction_type) with
+    the number of `events` and the total `duration` in seconds. Repeated
+    events are log-damped so a user re-opening a book all day does not
+    outweigh a purchase.
+    """
+    weights = aggregated['interaction_type'].map(INTERACTION_WEIGHTS).fillna(0.0).to_numpy(dtype=np.float64)
+    events = aggregated['events'].to_numpy(dtype=np.float64)
+    minutes = aggregated['duration'].fillna(0.0).to_numpy(dtype=np.float64) / 60.0
+    confidence = weights * np.log1p(events) + DURATION_WEIGHT * np.log1p(minutes)
+    frame = pd.DataFrame({
+        'user_id': aggregated['user_id'].to_numpy(),
+        'book_id': aggregated['book_id'].to_numpy(),
+        'confidence': confidence,
+    })
+    frame = frame.groupby(['user_id', 'book_id'], as_index=False, sort=False)['confidence'].sum()
+    return frame[frame['confidence'] > 0]
+
+
+interaction_buffer = InteractionBuffer(settings.INTERACTION_FLUSH_ROWS, settings.INTERACTION_FLUSH_INTERVAL)
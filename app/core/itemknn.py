@@ -0,0 +1,63 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from app.core.artifacts import arrays_to_sparse, sparse_to_arrays
+from app.core.similarity import build_topk_similarity
+
+
+class ItemKNN:
+    """Item-based k-nearest-neighbour rating prediction over a sparse rating matrix.
+
+    Every item keeps its k most cosine-similar items, computed blockwise
+    from the item columns of the rating matrix. A user's predicted rating
+    for an item is the similarity-weighted mean of their ratings of those
+    neighbours, as in KNNBasic; items with fewer than min_k rated
+    neighbours fall back to the global mean. Predictions are clipped to
+    rating_scale.
+    """
+
+    def __init__(self, k: int = 40, min_k: int = 1, rating_scale=(1, 5)):
+        self.k = k
+        self.min_k = min_k
+        self.rating_scale = tuple(rating_scale)
+        self.global_mean = None
+        # Transposed neighbour similarities: row j holds the items that have j as a neighbour
+        self.weights = None
+
+    def fit(self, ratings: csr_matrix, max_block_elements: int = 2 ** 24, n_jobs: int = 1) -> "ItemKNN":
+        """Fit on a users x items rating matrix, absent entries are unrated"""
+        ratings = csr_matrix(ratings, dtype=np.float32)
+        self.global_mean = float(ratings.data.mean()) if ratings.nnz else float(np.mean(self.rating_scale))
+        similarity = build_topk_similarity(ratings.T, k=self.k, max_block_elements=max_block_elements,
+                                           n_jobs=n_jobs)
+        self.weights = similarity.T.tocsr()
+        return self
+
+    def predict(self, user_rows: csr_matrix) -> np.ndarray:
+        """Dense (n_users x n_items) predicted ratings for a batch of rating rows"""
+        user_rows = csr_matrix(user_rows, dtype=np.float32)
+        rated = csr_matrix((np.ones_like(user_rows.data), user_rows.indices, user_rows.indptr),
+                           shape=user_rows.shape)
+        weights = self.weights
+        linked = csr_matrix((np.ones_like(weights.data), weights.indices, weights.indptr), shape=weights.shape)
+
+        sum_ratings = (user_rows @ weights).toarray()
+        sum_sim = (rated @ weights).toarray()
+        possible = (rated @ linked).toarray() >= self.min_k
+        possible &= sum_sim > 0
+
+        estimates = np.full(sum_ratings.shape, self.global_mean, dtype=np.float32)
+        np.divide(sum_ratings, sum_sim, out=estimates, where=possible)
+        lower_bound, higher_bound = self.rating_scale
+        return np.clip(estimates, lower_bound, higher_bound)
+
+    def to_arrays(self):
+        return sparse_to_arrays('weights', self.weights)
+
+    @classmethod
+    def from_arrays(cls, arrays, k: int, min_k: int, rating_scale, global_mean: float) -> "ItemKNN":
+        """Rebuild a fitted model from the arrays returned by to_arrays()"""
+        model = cls(k=k, min_k=min_k, rating_scale=rating_scale)
+        model.global_mean = global_mean
+        model.weights = arrays_to_sparse('weights', arrays)
+        return model
@@ -0,0 +1,81 @@
+"""Streaming load of the ratings table into a users x catalog CSR matrix.
+
+Ratings are read with a server-side cursor ordered by user, so user codes
+are assigned as rows arrive and the CSR arrays are filled in place. Peak
+memory is the final matrix plus one chunk, instead of a DataFrame of
+Python UUID objects per rating.
+"""
+from typing import Sequence, Tuple
+from uuid import UUID
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+from app.db.postgres.session import engine
+
+
+def load_ratings_matrix(book_ids: Sequence[UUID], chunksize: int = 100000) -> Tuple[np.ndarray, csr_matrix]:
+    """(user_ids, ratings) with one float32 row per user and one column per entry of book_ids.
+
+    Ratings of books missing from book_ids are skipped.
+    """
+    book_index = pd.Series(np.arange(len(book_ids)), index=[str(book_id) for book_id in book_ids])
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        # Count and stream from one snapshot so the preallocated arrays fit
+        cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+        cursor.execute("SELECT COUNT(*) FROM ratings")
+        capacity = cursor.fetchone()[0]
+        index_dtype = np.int32 if max(capacity, len(book_ids)) < 2 ** 31 else np.int64
+        indices = np.empty(capacity, dtype=index_dtype)
+        data = np.empty(capacity, dtype=np.float32)
+
+        stream = connection.cursor(name="ratings_matrix")
+        stream.itersize = chunksize
+        stream.execute("SELECT user_id::text, book_id::text, rating FROM ratings ORDER BY user_id")
+
+        user_ids, row_counts = [], []
+        last_user, nnz = None, 0
+        while True:
+            rows = stream.fetchmany(chunksize)
+            if not rows:
+                break
+            users, books, ratings = zip(*rows)
+            users = np.asarray(users, dtype=object)
+            cols = book_index.reindex(books).to_numpy()
+            known = ~np.isnan(cols)
+
+            # Rows are sorted by user, so a new code starts wherever the id changes
+            starts = np.empty(len(users), dtype=bool)
+            starts[0] = users[0] != last_user
+            starts[1:] = users[1:] != users[:-1]
+            codes = np.cumsum(starts) - int(starts[0])
+            counts = np.bincount(codes[known], minlength=codes[-1] + 1)
+            if not starts[0]:
+                row_counts[-1] += counts[0]
+                counts = counts[1:]
+            row_counts.extend(counts.tolist())
+            user_ids.extend(users[starts].tolist())
+            last_user = users[-1]
+
+            count = int(known.sum())
+            indices[nnz:nnz + count] = cols[known]
+            data[nnz:nnz + count] = np.asarray(ratings, dtype=np.float32)[known]
+            nnz += count
+        stream.close()
+        connection.rollback()
+    finally:
+        connection.close()
+
+    indptr = np.zeros(len(row_counts) + 1, dtype=index_dtype)
+    np.cumsum(row_counts, out=indptr[1:])
+    matrix = csr_matrix(
+        (data[:nnz], indices[:nnz], indptr),
+        shape=(len(user_ids), len(book_ids)),
+        copy=False
+    )
+    matrix.sort_indices()
+    return np.array([UUID(user_id) for user_id in user_ids], dtype=object), matrix
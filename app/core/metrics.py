@@ -0,0 +1,211 @@
+"""Request instrumentation: latency histograms, timing spans and an opt-in sampling profiler.
+
+Histograms are kept in process and rendered in the Prometheus text format
+by GET /metrics, so every worker process reports its own series. Spans
+time the hot-path stages of a request (database calls, scoring, ranking,
+metadata lookup, serialization); each one is observed in a histogram and
+also recorded for the current request, which the API returns in the
+Server-Timing header.
+"""
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+from uuid import uuid4
+
+from sqlalchemy import event
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _label_value(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histogram:
+    """Cumulative latency histogram with one series per combination of label values"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> ([count per bucket, +Inf last], sum)
+        self._series: Dict[Tuple[str, ...], List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues):
+        labelvalues = tuple(str(label) for label in labelvalues)
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bucket] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = [(labelvalues, list(counts), total) for labelvalues, (counts, total) in self._series.items()]
+        for labelvalues, counts, total in sorted(series):
+            labels = ','.join(f'{name}="{_label_value(value)}"' for name, value in zip(self.labelnames, labelvalues))
+            prefix = f'{labels},' if labels else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+            suffix = f'{{{labels}}}' if labels else ''
+            lines.append(f'{self.name}_sum{suffix} {total}')
+            lines.append(f'{self.name}_count{suffix} {cumulative}')
+        return lines
+
+
+class Metrics:
+    """The histograms exposed by GET /metrics"""
+
+    def __init__(self):
+        self._histograms: Dict[str, Histogram] = {}
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        if name not in self._histograms:
+            self._histograms[name] = Histogram(name, documentation, labelnames, buckets)
+        return self._histograms[name]
+
+    def render(self) -> str:
+        return '\n'.join(line for histogram in self._histograms.values() for line in histogram.render()) + '\n'
+
+
+metrics = Metrics()
+REQUEST_SECONDS = metrics.histogram(
+    'http_request_duration_seconds', 'Time until the response headers are sent, by route template',
+    ('method', 'route', 'status')
+)
+RECOMMENDATION_SECONDS = metrics.histogram(
+    'recommendation_duration_seconds', 'Time to produce recommendations, cache hits included, by algorithm',
+    ('algorithm',)
+)
+SPAN_SECONDS = metrics.histogram('span_duration_seconds', 'Time spent in each instrumented stage', ('span',))
+
+# Spans of the request being handled, None outside of requests
+_request_spans: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar('request_spans', default=None)
+
+
+def start_request_spans() -> List[Tuple[str, float]]:
+    """Collect the spans of the current request (and of the threads it hands work to) into a new list"""
+    spans = []
+    _request_spans.set(spans)
+    return spans
+
+
+def record_span(name: str, seconds: float):
+    SPAN_SECONDS.observe(seconds, name)
+    spans = _request_spans.get()
+    if spans is not None:
+        spans.append((name, seconds))
+
+
+@contextmanager
+def span(name: str, histogram: Histogram = None, labels: Sequence = ()):
+    """Time a block as span `name`, and observe it in `histogram` with `labels` as well when given"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        record_span(name, elapsed)
+        if histogram is not None:
+            histogram.observe(elapsed, *labels)
+
+
+def server_timing(spans: List[Tuple[str, float]]) -> str:
+    """Server-Timing header value with the total milliseconds and count per span name"""
+    totals: Dict[str, List] = {}
+    for name, seconds in spans:
+        total = totals.setdefault(name, [0.0, 0])
+        total[0] += seconds
+        total[1] += 1
+    return ', '.join(
+        f'{name};dur={seconds * 1000:.3f}' + (f';desc="{count} calls"' if count > 1 else '')
+        for name, (seconds, count) in totals.items()
+    )
+
+
+def instrument_engine(engine, name: str = 'db'):
+    """Record every statement executed through a SQLAlchemy engine as a span.
+
+    Only statement execution is timed, rows fetched later from a
+    server-side cursor are not.
+    """
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('span_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        record_span(name, time.perf_counter() - conn.info['span_started'].pop())
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(context):
+        started = context.connection.info.get('span_started') if context.connection is not None else None
+        if started:
+            record_span(name, time.perf_counter() - started.pop())
+
+
+class SamplingProfiler:
+    """Samples the Python stacks of every other thread at a fixed interval.
+
+    Meant for one request at a time while debugging: the samples include
+    whatever else the worker runs concurrently, each stack is prefixed
+    with its thread name. dump() writes them in the folded format read by
+    flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stopped.set()
+        self._thread.join()
+        return self.samples
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def dump(self, directory: str, label: str) -> str:
+        """Write the folded stacks to a new file in directory, returns its path"""
+        os.makedirs(directory, exist_ok=True)
+        safe_label = ''.join(char if char.isalnum() else '_' for char in label).strip('_')
+        name = f'{time.strftime("%Y%m%dT%H%M%S")}-{safe_label}-{uuid4().hex[:8]}.folded'
+        path = os.path.join(directory, name)
+        with open(path, 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f'{stack} {count}\n')
+        return path
@@ -0,0 +1,363 @@
+import threading
+from bisect import bisect_left
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix, issparse, vstack
+
+
+class RowLog:
+    """Append-only log of row values shared by successive snapshots of a model.
+
+    Every write appends a value and records its slot under the row index it
+    replaces, so a snapshot that saw the first `size` slots keeps reading
+    the same values however many are appended after it. Appending from a
+    snapshot that is not the newest copies its part of the log first.
+    """
+
+    def __init__(self):
+        # Row index -> slots written for it, in increasing order
+        self.slots: Dict[int, List[int]] = {}
+        self.size = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def append(self, size: int, indices, values) -> Tuple['RowLog', int]:
+        """Write values for indices after the first `size` slots, returns the log holding them and its new size"""
+        with self._lock:
+            log = self if size == self.size else self._branch(size)
+            log._write(size, values)
+            for offset, index in enumerate(indices):
+                log.slots.setdefault(int(index), []).append(size + offset)
+            log.size = size + len(indices)
+            return log, log.size
+
+    def latest(self, index: int, size: int) -> Optional[int]:
+        """Last slot written for index among the first `size`, None when there is none"""
+        slots = self.slots.get(index)
+        if not slots:
+            return None
+        pos = bisect_left(slots, size)
+        return slots[pos - 1] if pos else None
+
+    def _branch(self, size: int) -> 'RowLog':
+        log = self._empty()
+        log.slots = {index: [slot for slot in slots if slot < size] for index, slots in self.slots.items()}
+        log.slots = {index: slots for index, slots in log.slots.items() if slots}
+        log._write(0, self._read(slice(0, size)))
+        log.size = size
+        return log
+
+    def _empty(self) -> 'RowLog':
+        raise NotImplementedError
+
+    def _write(self, start: int, values):
+        raise NotImplementedError
+
+    def _read(self, slots):
+        raise NotImplementedError
+
+
+class ObjectLog(RowLog):
+    """RowLog of arbitrary Python values, e.g. sparse rows"""
+
+    def __init__(self):
+        super().__init__()
+        self.values: list = []
+
+    def _empty(self) -> 'ObjectLog':
+        return ObjectLog()
+
+    def _write(self, start: int, values):
+        del self.values[start:]
+        self.values.extend(values)
+
+    def _read(self, slots):
+        return self.values[slots]
+
+
+class DenseLog(RowLog):
+    """RowLog of fixed-width rows in a buffer that doubles when full, appending a row is amortized O(row)"""
+
+    def __init__(self, n_columns: int, dtype=np.float32, capacity: int = 64):
+        super().__init__()
+        self.rows = np.empty((capacity, n_columns), dtype=dtype)
+
+    def _empty(self) -> 'DenseLog':
+        return DenseLog(self.rows.shape[1], self.rows.dtype)
+
+    def _write(self, start: int, values):
+        values = np.asarray(values, dtype=self.rows.dtype).reshape(-1, self.rows.shape[1])
+        stop = start + len(values)
+        if stop > len(self.rows):
+            grown = np.empty((max(stop, 2 * len(self.rows)), self.rows.shape[1]), dtype=self.rows.dtype)
+            grown[:start] = self.rows[:start]
+            # Readers of older snapshots may still hold the old buffer, it keeps their rows
+            self.rows = grown
+        self.rows[start:stop] = values
+
+    def _read(self, slots):
+        return self.rows[slots]
+
+
+class Overlay:
+    """Immutable view of the first `size` entries of an ObjectLog, by row index"""
+
+    def __init__(self, log: ObjectLog = None, size: int = 0):
+        self.log = log if log is not None else ObjectLog()
+        self.size = size
+
+    def __len__(self) -> int:
+        return self.size
+
+    def get(self, index: int, default=None):
+        slot = self.log.latest(int(index), self.size)
+        return default if slot is None else self.log.values[slot]
+
+    def revision(self, index: int) -> Optional[int]:
+        """Slot of the row's latest write, changes with every write to it; None when never written"""
+        return self.log.latest(int(index), self.size)
+
+    def items(self) -> Iterator[Tuple[int, object]]:
+        """Latest visible (index, value) of every row written so far"""
+        for index in list(self.log.slots):
+            slot = self.log.latest(index, self.size)
+            if slot is not None:
+                yield index, self.log.values[slot]
+
+    def with_values(self, indices, values) -> 'Overlay':
+        return Overlay(*self.log.append(self.size, indices, values))
+
+
+class FactorOverlay:
+    """Factor matrix of a trained model with rows replaced or appended after training.
+
+    The trained `base` array, typically memory-mapped, is never written:
+    new rows go to a DenseLog shared with the overlay they were derived
+    from, which keeps reading its own rows. `gram_delta` tracks how the
+    Gram matrix (factors.T @ factors) moved away from the base one, which
+    the least-squares fold-in needs.
+    """
+
+    def __init__(self, base: np.ndarray, log: DenseLog = None, size: int = 0, n_rows: int = None,
+                 gram_delta: np.ndarray = None):
+        self.base = base
+        self.log = log if log is not None else DenseLog(base.shape[1], dtype=base.dtype)
+        self.size = size
+        self.n_rows = len(base) if n_rows is None else n_rows
+        self.gram_delta = gram_delta if gram_delta is not None else np.zeros((base.shape[1],) * 2, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return self.n_rows
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.n_rows, self.base.shape[1]
+
+    def __getitem__(self, indices) -> np.ndarray:
+        if np.isscalar(indices):
+            return self.take([indices])[0]
+        return self.take(indices)
+
+    def take(self, indices) -> np.ndarray:
+        """Rows at the given indices, rows past the trained ones that were never written are zero"""
+        indices = np.asarray(indices, dtype=np.int64).ravel()
+        trained = indices < len(self.base)
+        rows = np.zeros((len(indices), self.base.shape[1]), dtype=self.base.dtype)
+        rows[trained] = self.base[indices[trained]]
+        if self.size:
+            for i, index in enumerate(indices):
+                slot = self.log.latest(int(index), self.size)
+                if slot is not None:
+                    rows[i] = self.log.rows[slot]
+        return rows
+
+    def appended(self) -> np.ndarray:
+        """Rows past the trained ones, in index order"""
+        return self.take(np.arange(len(self.base), self.n_rows))
+
+    def with_rows(self, indices, rows) -> 'FactorOverlay':
+        """Copy with the rows at indices set, growing the matrix as needed"""
+        indices = np.asarray(indices, dtype=np.int64)
+        rows = np.asarray(rows, dtype=self.base.dtype).reshape(len(indices), -1)
+        old = self.take(indices).astype(np.float64)
+        gram_delta = self.gram_delta + rows.T.astype(np.float64) @ rows - old.T @ old
+        log, size = self.log.append(self.size, indices, rows)
+        n_rows = max(self.n_rows, int(indices.max()) + 1 if len(indices) else 0)
+        return FactorOverlay(self.base, log, size, n_rows, gram_delta)
+
+    def to_array(self) -> np.ndarray:
+        """Full factor matrix with every written row, the base array itself when nothing was written"""
+        if not self.size:
+            return self.base
+        factors = np.zeros(self.shape, dtype=self.base.dtype)
+        factors[:len(self.base)] = self.base
+        for index in list(self.log.slots):
+            slot = self.log.latest(index, self.size)
+            if slot is not None:
+                factors[index] = self.log.rows[slot]
+        return factors
+
+
+class PatchedMatrix:
+    """Sparse matrix with rows replaced or appended after it was built.
+
+    The patched rows live in a CSR matrix of their own, sorted by row, and
+    are merged over `base` by every lookup and product, so patching costs
+    the patched rows instead of a copy of the whole matrix and a base
+    loaded memory-mapped stays shared between processes. Columns past the
+    base ones only exist in patched rows. Patching returns a new matrix.
+    """
+
+    # Make scipy defer `sparse @ patched` to __rmatmul__
+    __array_priority__ = 100
+
+    def __init__(self, base: csr_matrix, shape: Tuple[int, int] = None, patch_ids: np.ndarray = None,
+                 patch_rows: csr_matrix = None, base_minimums: list = None):
+        self.base = base
+        self.shape = tuple(shape) if shape is not None else base.shape
+        self.patch_ids = patch_ids if patch_ids is not None else np.empty(0, dtype=np.int64)
+        self.patch_rows = patch_rows if patch_rows is not None else csr_matrix((0, self.shape[1]), dtype=base.dtype)
+        self._delta = None
+        # Entry counts and minimums of the base rows, computed once and shared with patched copies
+        self._base_minimums = base_minimums if base_minimums is not None else []
+
+    @property
+    def dtype(self):
+        return self.base.dtype
+
+    def _patch_positions(self, indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Position in patch_rows of every index and whether it is patched at all"""
+        pos = np.searchsorted(self.patch_ids, indices)
+        pos[pos == len(self.patch_ids)] = 0
+        patched = self.patch_ids[pos] == indices if len(self.patch_ids) else np.zeros(len(indices), dtype=bool)
+        return pos, patched
+
+    def row(self, idx: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Column indices and values stored for one row"""
+        pos, patched = self._patch_positions(np.array([idx]))
+        if patched[0]:
+            matrix, idx = self.patch_rows, pos[0]
+        elif idx < self.base.shape[0]:
+            matrix = self.base
+        else:
+            return np.empty(0, dtype=self.base.indices.dtype), np.empty(0, dtype=self.dtype)
+        start, stop = matrix.indptr[idx], matrix.indptr[idx + 1]
+        return matrix.indices[start:stop], matrix.data[start:stop]
+
+    def rows(self, indices) -> csr_matrix:
+        """The given rows as a (len(indices), n_columns) CSR matrix"""
+        indices = np.asarray(indices, dtype=np.int64)
+        pos, patched = self._patch_positions(indices)
+        from_base = ~patched & (indices < self.base.shape[0])
+        selected = np.arange(len(indices))
+        pick_base = csr_matrix(
+            (np.ones(from_base.sum(), dtype=self.dtype), (selected[from_base], indices[from_base])),
+            shape=(len(indices), self.base.shape[0])
+        )
+        pick_patch = csr_matrix(
+            (np.ones(patched.sum(), dtype=self.dtype), (selected[patched], pos[patched])),
+            shape=(len(indices), len(self.patch_ids))
+        )
+        return (_with_columns(pick_base @ self.base, self.shape[1]) + pick_patch @ self.patch_rows).tocsr()
+
+    def rows_with_columns(self, columns) -> np.ndarray:
+        """Sorted indices of the rows storing an entry in any of the given columns"""
+        found = []
+        for matrix, ids in ((self.base, None), (self.patch_rows, self.patch_ids)):
+            positions = np.flatnonzero(np.isin(matrix.indices, columns))
+            rows = np.searchsorted(matrix.indptr, positions, side='right') - 1
+            found.append(rows if ids is None else ids[rows])
+        base_rows = found[0]
+        # Patched rows no longer hold what the base stores for them
+        return np.union1d(base_rows[~self._patch_positions(base_rows)[1]], found[1])
+
+    def row_minimums(self, indices) -> Tuple[np.ndarray, np.ndarray]:
+        """Number of stored entries and smallest stored value (inf when empty) of the given rows"""
+        indices = np.asarray(indices, dtype=np.int64)
+        counts = np.zeros(len(indices), dtype=np.int64)
+        minimums = np.full(len(indices), np.inf, dtype=np.float32)
+        pos, patched = self._patch_positions(indices)
+        from_base = ~patched & (indices < self.base.shape[0])
+        if not self._base_minimums:
+            self._base_minimums.append(_row_minimums(self.base))
+        base_counts, base_minimums = self._base_minimums[0]
+        counts[from_base], minimums[from_base] = base_counts[indices[from_base]], base_minimums[indices[from_base]]
+        if patched.any():
+            patch_counts, patch_minimums = _row_minimums(self.patch_rows)
+            counts[patched], minimums[patched] = patch_counts[pos[patched]], patch_minimums[pos[patched]]
+        return counts, minimums
+
+    def __matmul__(self, other) -> np.ndarray:
+        """Dense self @ other for an (n_columns, m) sparse or dense other"""
+        result = np.zeros((self.shape[0], other.shape[1]), dtype=np.float32)
+        result[:self.base.shape[0]] = _dense(self.base @ other[:self.base.shape[1]])
+        if len(self.patch_ids):
+            result[self.patch_ids] = _dense(self.patch_rows @ other)
+        return result
+
+    def __rmatmul__(self, other) -> np.ndarray:
+        """Dense other @ self for an (m, n_rows) sparse other"""
+        other = csr_matrix(other)
+        result = np.zeros((other.shape[0], self.shape[1]), dtype=np.float32)
+        result[:, :self.base.shape[1]] = _dense(other[:, :self.base.shape[0]] @ self.base)
+        if len(self.patch_ids):
+            result += _dense(other[:, self.patch_ids] @ self._patch_delta())
+        return result
+
+    def _patch_delta(self) -> csr_matrix:
+        """Patched rows minus what the base stores for them, computed once per matrix"""
+        if self._delta is None:
+            in_base = self.patch_ids < self.base.shape[0]
+            replaced = csr_matrix(
+                (np.ones(in_base.sum(), dtype=self.dtype), (np.flatnonzero(in_base), self.patch_ids[in_base])),
+                shape=(len(self.patch_ids), self.base.shape[0])
+            ) @ self.base
+            self._delta = (self.patch_rows - _with_columns(replaced, self.shape[1])).tocsr()
+        return self._delta
+
+    def with_rows(self, indices, rows: csr_matrix) -> 'PatchedMatrix':
+        """Copy with the rows at indices replaced by the rows of `rows`, in order, growing as needed"""
+        indices = np.asarray(indices, dtype=np.int64)
+        shape = (max(self.shape[0], int(indices.max()) + 1 if len(indices) else 0),
+                 max(self.shape[1], rows.shape[1]))
+        keep = ~np.isin(self.patch_ids, indices)
+        ids = np.concatenate((self.patch_ids[keep], indices))
+        stacked = vstack((
+            _with_columns(self.patch_rows[keep], shape[1]),
+            _with_columns(csr_matrix(rows, dtype=self.dtype), shape[1])
+        ), format='csr')
+        order = np.argsort(ids, kind='stable')
+        return PatchedMatrix(self.base, shape, ids[order], stacked[order], self._base_minimums)
+
+    def to_csr(self) -> csr_matrix:
+        """Merged matrix, the base itself when nothing was patched"""
+        if not len(self.patch_ids) and self.shape == self.base.shape:
+            return self.base
+        return self.rows(np.arange(self.shape[0]))
+
+
+def _with_columns(matrix: csr_matrix, n_columns: int) -> csr_matrix:
+    """The same CSR rows widened to n_columns, sharing the arrays"""
+    return csr_matrix((matrix.data, matrix.indices, matrix.indptr), shape=(matrix.shape[0], n_columns), copy=False)
+
+
+def _row_minimums(matrix: csr_matrix) -> Tuple[np.ndarray, np.ndarray]:
+    counts = np.diff(matrix.indptr)
+    minimums = np.full(matrix.shape[0], np.inf, dtype=np.float32)
+    nonempty = np.flatnonzero(counts)
+    if len(nonempty):
+        minimums[nonempty] = np.minimum.reduceat(matrix.data, matrix.indptr[nonempty])
+    return counts, minimums
+
+
+def _dense(matrix) -> np.ndarray:
+    return matrix.toarray() if issparse(matrix) else np.asarray(matrix)
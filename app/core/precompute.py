@@ -0,0 +1,110 @@
+"""Batch precomputation of recommendations into the `recommendations` table.
+
+Usage: python -m app.core.precompute [--algorithms hybrid als] [--top-n 20] [--workers 4]
+
+Scores every user known to the current model artifact in chunks across a
+process pool and bulk-loads the top-N rows per algorithm with COPY. The
+API serves these rows while they are fresh and falls back to live scoring
+otherwise.
+"""
+import argparse
+import csv
+import io
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.recommender import BookRecommender
+from app.db.postgres.session import engine
+
+ALGORITHMS = ("hybrid", "als")
+
+_recommender = None
+
+
+def _init_worker(artifact_dir: str):
+    # Every worker maps the same artifact files, so the arrays are shared
+    global _recommender
+    _recommender = BookRecommender()
+    if not _recommender.load(artifact_dir):
+        raise RuntimeError(f"No model artifacts in {artifact_dir}")
+
+
+def score_chunk(algorithm: str, user_ids: List[uuid.UUID], top_n: int):
+    """(user_id, book_id, score) rows of the top-N books for a chunk of users"""
+    if algorithm == "hybrid":
+        indices, scores = _recommender.hybrid_recommend_batch(user_ids, top_n)
+        encoder = _recommender.book_index
+    else:
+        indices, scores = _recommender.als_recommend_batch(user_ids, top_n)
+        encoder = _recommender.item_mapping
+    filled = np.asarray(indices) >= 0
+    book_ids = encoder.decode(np.asarray(indices)[filled])
+    users = np.repeat(np.asarray(user_ids, dtype=object), filled.sum(axis=1))
+    return list(zip(users, book_ids, np.asarray(scores)[filled].tolist()))
+
+
+def copy_rows(cursor, algorithm: str, rows):
+    """Bulk-load rows with COPY ... FROM STDIN"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for user_id, book_id, score in rows:
+        writer.writerow((uuid.uuid4(), user_id, book_id, score, algorithm))
+    buffer.seek(0)
+    cursor.copy_expert(
+        "COPY recommendations (id, user_id, book_id, score, algorithm) FROM STDIN WITH (FORMAT csv)",
+        buffer
+    )
+
+
+def precompute(algorithm: str, top_n: int, chunk_size: int, workers: int, artifact_dir: str):
+    recommender = BookRecommender()
+    if not recommender.load(artifact_dir):
+        raise RuntimeError(f"No model artifacts in {artifact_dir}")
+    if algorithm == "hybrid":
+        user_ids = list(recommender.rated_user_index)
+    else:
+        user_ids = list(recommender.user_mapping)
+    chunks = [user_ids[start:start + chunk_size] for start in range(0, len(user_ids), chunk_size)]
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        # Old rows stay visible to readers until the new set is committed
+        cursor.execute("DELETE FROM recommendations WHERE algorithm = %s", (algorithm,))
+        written = 0
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(artifact_dir,)) as pool:
+            for rows in pool.map(score_chunk, [algorithm] * len(chunks), chunks, [top_n] * len(chunks)):
+                copy_rows(cursor, algorithm, rows)
+                written += len(rows)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+    return len(user_ids), written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--algorithms", nargs="+", choices=ALGORITHMS, default=list(ALGORITHMS))
+    parser.add_argument("--top-n", type=int, default=20)
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--artifact-dir", default=settings.MODEL_ARTIFACT_DIR)
+    args = parser.parse_args()
+
+    for algorithm in args.algorithms:
+        started = time.perf_counter()
+        users, rows = precompute(algorithm, args.top_n, args.chunk_size, args.workers, args.artifact_dir)
+        print(f"{algorithm}: {rows} rows for {users} users in {time.perf_counter() - started:.1f} s", flush=True)
+
+
+if __name__ == "__main__":
+    main()
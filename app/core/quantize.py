@@ -0,0 +1,98 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+
+
+class QuantizedFactors:
+    """Int8 copy of a factor matrix for memory-bound inner-product search.
+
+    Every row is stored as int8 codes with one float32 scale (max |x| / 127),
+    a quarter of the float32 size. Candidates are ranked by the approximate
+    scores, then the best `oversample * n` of them are rescored with the
+    full-precision factors, which are only read for those rows and can stay
+    memory-mapped on disk.
+    """
+
+    def __init__(self, codes: np.ndarray, scales: np.ndarray, oversample: int = 4, block_size: int = 65536):
+        self.codes = codes
+        self.scales = scales
+        self.oversample = oversample
+        self.block_size = block_size
+
+    @classmethod
+    def from_factors(cls, factors: np.ndarray, oversample: int = 4, block_size: int = 65536) -> "QuantizedFactors":
+        codes = np.empty(factors.shape, dtype=np.int8)
+        scales = np.empty(len(factors), dtype=np.float32)
+        for start in range(0, len(factors), block_size):
+            codes[start:start + block_size], scales[start:start + block_size] = _quantize(
+                factors[start:start + block_size]
+            )
+        return cls(codes, scales, oversample=oversample, block_size=block_size)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.scales.nbytes
+
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        """Approximate (n_queries x n_rows) inner products, dequantizing one block of rows at a time"""
+        queries = np.asarray(queries, dtype=np.float32)
+        scores = np.empty((len(queries), len(self)), dtype=np.float32)
+        for start in range(0, len(self), self.block_size):
+            stop = start + self.block_size
+            np.matmul(queries, self.codes[start:stop].astype(np.float32).T, out=scores[:, start:stop])
+            scores[:, start:stop] *= self.scales[start:stop]
+        return scores
+
+    def search(self, queries: np.ndarray, n: int, factors: np.ndarray, exclude: csr_matrix = None):
+        """Top-n (ids, scores) per query, rescored with the full-precision `factors`.
+
+        `exclude` holds one sparse row per query whose column indices are
+        skipped, indices past the quantized rows are ignored. Returns two (n_queries, n) arrays, slots that could not be
+        filled have id -1.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        approximate = self.scores(queries)
+        if exclude is not None:
+            exclude = csr_matrix(exclude)
+            rows = np.repeat(np.arange(exclude.shape[0]), np.diff(exclude.indptr))
+            inside = exclude.indices < len(self)
+            approximate[rows[inside], exclude.indices[inside]] = -np.inf
+
+        n_candidates = min(max(n, self.oversample * n), len(self))
+        ids = np.full((len(queries), n), -1, dtype=np.int64)
+        scores = np.zeros((len(queries), n), dtype=np.float32)
+        if n_candidates == 0:
+            return ids, scores
+        candidates = np.argpartition(-approximate, n_candidates - 1, axis=1)[:, :n_candidates]
+        valid = np.isfinite(np.take_along_axis(approximate, candidates, axis=1))
+
+        exact = np.einsum('qcf,qf->qc', np.asarray(factors[candidates.ravel()], dtype=np.float32).reshape(
+            len(queries), n_candidates, -1), queries)
+        exact[~valid] = -np.inf
+        order = np.argsort(-exact, axis=1, kind='stable')[:, :n]
+        found = np.isfinite(np.take_along_axis(exact, order, axis=1))
+        top_ids = np.take_along_axis(candidates, order, axis=1)
+        top_scores = np.take_along_axis(exact, order, axis=1)
+        filled = order.shape[1]
+        ids[:, :filled] = np.where(found, top_ids, -1)
+        scores[:, :filled] = np.where(found, top_scores, 0)
+        return ids, scores
+
+    def to_arrays(self):
+        return {'codes': self.codes, 'scales': self.scales}
+
+    @classmethod
+    def from_arrays(cls, arrays, oversample: int = 4) -> "QuantizedFactors":
+        """Rebuild quantized factors from the arrays returned by to_arrays()"""
+        return cls(arrays['codes'], arrays['scales'], oversample=oversample)
+
+
+def _quantize(factors: np.ndarray):
+    """Symmetric per-row int8 codes and scales of a block of factors"""
+    factors = np.asarray(factors, dtype=np.float32)
+    scales = np.abs(factors).max(axis=1) / 127
+    safe = np.where(scales > 0, scales, 1)
+    codes = np.clip(np.rint(factors / safe[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
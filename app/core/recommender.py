@@ -1,157 +1,607 @@
+import copy
+import os
 from uuid import UUID
 
 import numpy as np
 import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.feature_extraction.text import TfidfVectorizer
-from surprise import Dataset, Reader, KNNBasic
-from surprise.model_selection import train_test_split
-from typing import List, Dict
-from scipy.sparse import csr_matrix , coo_matrix
+from typing import List, Dict, Tuple
+from scipy.sparse import csr_matrix , coo_matrix, diags, vstack
 import implicit
+from implicit.cpu.topk import topk
+
+from app.core.ann import IVFIndex
+from app.core.artifacts import arrays_to_sparse, current_version, load_version, save_version, sparse_to_arrays
+from app.core.content import ContentFeatures, book_text
+from app.core.ids import IdEncoder
+from app.core.itemknn import ItemKNN
+from app.core.metrics import span
+from app.core.overlay import FactorOverlay, Overlay, PatchedMatrix
+from app.core.quantize import QuantizedFactors
+from app.core.scoring import top_n_indices, weighted_similarity_sum, weighted_similarity_sum_rows
+from app.core.similarity import build_topk_similarity, update_topk_rows
 
 
 class BookRecommender:
     def __init__(self):
-        self.user_ratings = None
         self.book_features = None
         self.collab_model = None
         self.content_model = None
         self.tfidf_matrix = None
-        self.book_id_to_index = {}
-        self.index_to_book_id = {}
-        self.user_mapping = {}
-        self.item_mapping = {}
-        self.user_inverse_mapping = {}
-        self.item_inverse_mapping = {}
+        self.book_index = IdEncoder.from_ids([])
+        self.user_mapping = IdEncoder.from_ids([])
+        self.item_mapping = IdEncoder.from_ids([])
         self.user_item_matrix = None
+        # Rows changed since training, over the trained user_item_matrix and model factors
+        self.user_item_updates = Overlay()
+        self.user_factors = None
+        self.item_factors = None
         self.model = None
+        self.book_titles = None
+        self.book_authors = None
+        self.rated_user_index = IdEncoder.from_ids([])
+        self.rated_matrix = None
+        self.rated_counts = None
+        self.content_features = None
+        self.content_top_k = None
+        # Catalog edits applied since the artifact was loaded
+        self.catalog_revision = 0
+        self.ann_index = None
+        self.quantized_items = None
+        self.artifact_version = None
+
+    @property
+    def cache_version(self):
+        """Key of the served state for result caches, changes with the artifact and every catalog edit"""
+        if not self.catalog_revision:
+            return self.artifact_version
+        return f"{self.artifact_version}+{self.catalog_revision}"
+
+    def user_cache_version(self, user_id: UUID):
+        """cache_version for results computed for one user, also changes when their ratings are folded in"""
+        user_idx = self.user_mapping.get(user_id)
+        revision = None if user_idx is None else self.user_item_updates.revision(user_idx)
+        if revision is None:
+            return self.cache_version
+        return f"{self.cache_version}/{revision}"
 
     def load_data(self, ratings_df: pd.DataFrame, books_df: pd.DataFrame):
         """Load and preprocess data"""
-        self.user_ratings = ratings_df
+        book_idx = IdEncoder.from_ids(books_df['id']).encode(ratings_df['book_id'])
+        known = book_idx >= 0
+        user_codes, user_ids = pd.factorize(ratings_df['user_id'][known])
+        matrix = coo_matrix(
+            (ratings_df['rating'].to_numpy(dtype=np.float32)[known],
+             (user_codes, book_idx[known])),
+            shape=(len(user_ids), len(books_df))
+        ).tocsr()
+        self.load_matrix(np.asarray(user_ids, dtype=object), matrix, books_df)
+
+    def load_matrix(self, user_ids: np.ndarray, ratings: csr_matrix, books_df: pd.DataFrame):
+        """Load ratings already encoded as a users x books matrix aligned with books_df"""
         self.book_features = books_df
 
-        # Create mappings
-        self.book_id_to_index = {bid: idx for idx, bid in enumerate(books_df['id'])}
-        self.index_to_book_id = {v: k for k, v in self.book_id_to_index.items()}
+        # Catalog ids and index-aligned metadata for vectorized lookups
+        self.book_index = IdEncoder.from_ids(books_df['id'])
+        self.book_titles = books_df['title'].to_numpy()
+        self.book_authors = books_df['author'].to_numpy()
 
-    def train_collaborative(self):
-        """Train collaborative filtering model"""
-        reader = Reader(rating_scale=(1, 5))
-        data = Dataset.load_from_df(
-            self.user_ratings[['user_id', 'book_id', 'rating']],
-            reader
-        )
-        trainset, _ = train_test_split(data, test_size=0.2)
-        self.collab_model = KNNBasic(sim_options={'name': 'cosine', 'user_based': False})
-        self.collab_model.fit(trainset)
-
-    def train_content_based(self):
-        """Train content-based model"""
-        tfidf = TfidfVectorizer(stop_words='english')
-        combined_features = (
-                self.book_features['title'] + " " +
-                self.book_features['author'] + " " +
-                self.book_features['genres'].apply(lambda x: ' '.join(x))
+        # Users x books rating matrix aligned with the catalog order
+        self.rated_user_index = IdEncoder.from_ids(user_ids)
+        self.rated_matrix = ratings
+        self.rated_counts = np.diff(ratings.indptr)
+
+    def train_collaborative(self, k=40, min_k=1, rating_scale=(1, 5), n_jobs=1):
+        """Train item-based collaborative filtering on every loaded rating"""
+        self.collab_model = ItemKNN(k=k, min_k=min_k, rating_scale=rating_scale).fit(self.rated_matrix, n_jobs=n_jobs)
+
+    def train_content_based(self, top_k=100, n_jobs=1, hashing=False, n_features=2 ** 18):
+        """Train content-based model on title, author, genres and description.
+
+        hashing=True hashes terms into n_features columns instead of learning
+        a vocabulary, so books added later keep terms the catalog did not
+        have at training time.
+        """
+        self.content_features = ContentFeatures(hashing=hashing, n_features=n_features)
+        tfidf = self.content_features.fit_transform(book_text(self.book_features))
+        self.content_top_k = top_k
+        self.tfidf_matrix = PatchedMatrix(tfidf)
+        self.content_model = PatchedMatrix(build_topk_similarity(tfidf, k=top_k, n_jobs=n_jobs))
+
+    def with_books(self, books: pd.DataFrame) -> 'BookRecommender':
+        """Copy of the recommender with new or edited books in the catalog and content index.
+
+        `books` has the columns of the books table. Their text is vectorized
+        with the trained content features and their similarity rows are
+        recomputed against the whole catalog, so get_similar_books reflects
+        them right away. New books score the global mean in collaborative
+        filtering until the next training run.
+
+        The TF-IDF and similarity matrices of the copy are patched views
+        sharing the trained (memory-mapped) arrays: an edit scans the
+        features and the stored similarity indices once and stores only the
+        rows it changes. Title and author lookups are copied per edit, and
+        new books also copy the indptr of the ratings and item-item
+        matrices, so an edit still costs O(n_books + n_users) plus the
+        patched rows so far.
+        """
+        books = books.drop_duplicates('id', keep='last')
+        ids = books['id'].tolist()
+        updated = copy.copy(self)
+        updated.book_index = self.book_index.extended(ids)
+        codes = updated.book_index.encode(ids)
+        n_books = len(updated.book_index)
+
+        titles = np.empty(n_books, dtype=object)
+        titles[:len(self.book_titles)] = self.book_titles
+        titles[codes] = books['title'].to_numpy()
+        authors = np.empty(n_books, dtype=object)
+        authors[:len(self.book_authors)] = self.book_authors
+        authors[codes] = books['author'].to_numpy()
+        updated.book_titles, updated.book_authors = titles, authors
+
+        updated.tfidf_matrix = self.tfidf_matrix.with_rows(codes, self.content_features.transform(book_text(books)))
+        updated.content_model = update_topk_rows(
+            self.content_model, updated.tfidf_matrix, codes, k=self.content_top_k
         )
-        self.tfidf_matrix = tfidf.fit_transform(combined_features)
-        self.content_model = cosine_similarity(self.tfidf_matrix)
+
+        if n_books > len(self.book_index):
+            updated.rated_matrix = _resized(self.rated_matrix, (self.rated_matrix.shape[0], n_books))
+            if self.collab_model is not None:
+                updated.collab_model = copy.copy(self.collab_model)
+                updated.collab_model.weights = _resized(self.collab_model.weights, (n_books, n_books))
+        updated.catalog_revision = self.catalog_revision + 1
+        return updated
+
+    def collaborative_scores(self, user_id: UUID) -> np.ndarray:
+        """Predicted rating of every catalog book for a user"""
+        return self.collaborative_scores_batch([user_id])[0]
+
+    def collaborative_scores_batch(self, user_ids: List[UUID]) -> np.ndarray:
+        """(len(user_ids), n_books) predicted ratings, the global mean for users without ratings"""
+        with span("collab_scoring"):
+            rows = self.rated_user_index.encode(user_ids)
+            known = rows >= 0
+            scores = np.full((len(user_ids), len(self.book_index)), self.collab_model.global_mean, dtype=np.float32)
+            if known.any():
+                scores[known] = self.collab_model.predict(self.rated_matrix[rows[known]])
+            return scores
+
+    def content_scores(self, user_id: UUID) -> np.ndarray:
+        """Rating-weighted average content similarity of every book to the user's rated books"""
+        with span("content_scoring"):
+            user_idx = self.rated_user_index.get(user_id)
+            if user_idx is None:
+                return np.zeros(len(self.book_index), dtype=np.float32)
+            user_row = self.rated_matrix[user_idx]
+            return weighted_similarity_sum(user_row, self.content_model) / np.float32(self.rated_counts[user_idx])
 
     def hybrid_recommend(self, user_id: UUID, top_n: int = 5) -> List[Dict]:
         """Generate hybrid recommendations"""
-        # Get collaborative predictions
-        collab_recs = []
-        for book_id in self.book_features['id']:
-            pred = self.collab_model.predict(user_id, book_id)
-            collab_recs.append((book_id, pred.est))
-
-        # Get content-based scores for user's rated books
-        user_rated = self.user_ratings[self.user_ratings['user_id'] == user_id]
-        if len(user_rated) > 0:
-            avg_content_scores = np.zeros(len(self.book_features))
-            for _, row in user_rated.iterrows():
-                book_idx = self.book_id_to_index[row['book_id']]
-                content_scores = self.content_model[book_idx]
-                weighted_scores = content_scores * row['rating']
-                avg_content_scores += weighted_scores
-            avg_content_scores /= len(user_rated)
-        else:
-            avg_content_scores = np.zeros(len(self.book_features))
-
-        # Combine scores
-        recommendations = []
-        for book_id, collab_score in collab_recs:
-            book_idx = self.book_id_to_index[book_id]
-            hybrid_score = 0.6 * collab_score + 0.4 * avg_content_scores[book_idx]
-            recommendations.append((book_id, hybrid_score))
-
-        # Sort and return top N
-        recommendations.sort(key=lambda x: x[1], reverse=True)
-        return [{
-            'book_id': book_id,
-            'score': score,
-            'title': self.book_features[self.book_features['id'] == book_id]['title'].values[0],
-            'author': self.book_features[self.book_features['id'] == book_id]['author'].values[0]
-        } for book_id, score in recommendations[:top_n]]
+        scores = 0.6 * self.collaborative_scores(user_id) + 0.4 * self.content_scores(user_id)
+        with span("ranking"):
+            top = top_n_indices(scores, top_n)
+        return self._book_records(top, scores[top])
+
+    def hybrid_recommend_batch(self, user_ids: List[UUID], top_n: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-N catalog indices and scores for many users.
+
+        Collaborative and content scores for the whole batch each come from
+        sparse products over the batch's rating rows. Returns two
+        (len(user_ids), top_n) arrays.
+        """
+        with span("content_scoring"):
+            rows = self.rated_user_index.encode(user_ids)
+            content = np.zeros((len(user_ids), len(self.book_index)), dtype=np.float32)
+            known = rows >= 0
+            if known.any():
+                content[known] = weighted_similarity_sum_rows(self.rated_matrix[rows[known]], self.content_model)
+                content[known] /= self.rated_counts[rows[known], None]
+
+        top_n = min(top_n, len(self.book_index))
+        indices = np.empty((len(user_ids), top_n), dtype=np.int64)
+        scores = np.empty((len(user_ids), top_n), dtype=np.float32)
+        batch_scores = 0.6 * self.collaborative_scores_batch(user_ids) + 0.4 * content
+        with span("ranking"):
+            for i, user_scores in enumerate(batch_scores):
+                indices[i] = top_n_indices(user_scores, top_n)
+                scores[i] = user_scores[indices[i]]
+        return indices, scores
+
+    def _book_records(self, indices: np.ndarray, scores: np.ndarray) -> List[Dict]:
+        with span("metadata"):
+            return [{
+                'book_id': book_id,
+                'score': float(score),
+                'title': self.book_titles[idx],
+                'author': self.book_authors[idx]
+            } for book_id, idx, score in zip(self.book_index.decode(indices), indices, scores)]
 
     def get_similar_books(self, book_id: UUID, top_n: int = 5) -> List[Dict]:
-        """Content-based similar books"""
-        book_idx = self.book_id_to_index[book_id]
-        sim_scores = list(enumerate(self.content_model[book_idx]))
-        sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)[1:top_n + 1]
-        return [{
-            'book_id': self.index_to_book_id[idx],
-            'score': score,
-            'title': self.book_features.iloc[idx]['title'],
-            'author': self.book_features.iloc[idx]['author']
-        } for idx, score in sim_scores]
-
-    def train_als(self, factors=50, iterations=15, regularization=0.01):
-        """Train ALS model using implicit library"""
-        # Create mappings for user and item IDs
-        unique_users = self.user_ratings['user_id'].unique()
-        unique_items = self.user_ratings['book_id'].unique()
-
-        self.user_mapping = {user_id: idx for idx, user_id in enumerate(unique_users)}
-        self.item_mapping = {item_id: idx for idx, item_id in enumerate(unique_items)}
-        self.user_inverse_mapping = {idx: user_id for user_id, idx in self.user_mapping.items()}
-        self.item_inverse_mapping = {idx: item_id for item_id, idx in self.item_mapping.items()}
-
-        # Create sparse user-item matrix in COO format (then convert to CSR)
-        rows = self.user_ratings['user_id'].map(self.user_mapping)
-        cols = self.user_ratings['book_id'].map(self.item_mapping)
-        ratings = self.user_ratings['rating'].values
-
-        self.user_item_matrix = coo_matrix((ratings, (rows, cols)),
-                                           shape=(len(unique_users), len(unique_items))).tocsr()
+        """Content-based similar books, none for books unknown to the model"""
+        book_idx = self.book_index.get(book_id)
+        if book_idx is None:
+            return []
+        with span("ranking"):
+            neighbours, scores = self.content_model.row(book_idx)
+            candidates = neighbours != book_idx
+            neighbours, scores = neighbours[candidates], scores[candidates]
+            order = top_n_indices(scores, top_n)
+        return self._book_records(neighbours[order], scores[order])
+
+    def train_als(self, factors=50, iterations=15, regularization=0.01, interactions: pd.DataFrame = None,
+                  num_threads=0):
+        """Train ALS model using implicit library.
+
+        `interactions` is an optional frame of (user_id, book_id, confidence)
+        from implicit feedback, added to the explicit ratings of the same
+        user-book pairs. num_threads=0 uses every core.
+        """
+        # Users and items share the codes of the loaded ratings matrix
+        self.user_mapping = self.rated_user_index
+        self.item_mapping = self.book_index
+        matrix = self.rated_matrix
+        if interactions is not None and len(interactions):
+            cols = self.item_mapping.encode(interactions['book_id'])
+            interactions = interactions[cols >= 0]
+            self.user_mapping = self.user_mapping.extended(interactions['user_id'].unique())
+            shape = (len(self.user_mapping), len(self.item_mapping))
+            # Duplicate user-book pairs are summed
+            matrix = _resized(matrix, shape) + coo_matrix(
+                (interactions['confidence'].to_numpy(dtype=np.float32),
+                 (self.user_mapping.encode(interactions['user_id']), cols[cols >= 0])),
+                shape=shape
+            ).tocsr()
+        self.user_item_matrix = matrix.astype(np.float32, copy=False)
 
         # Train ALS model
         self.model = implicit.als.AlternatingLeastSquares(
             factors=factors,
             iterations=iterations,
             regularization=regularization,
-            random_state=42
+            random_state=42,
+            num_threads=num_threads
         )
 
         # Fit the model (implicit expects confidence values, so we pass the ratings directly)
         self.model.fit(self.user_item_matrix)
+        self.user_item_updates = Overlay()
+        self.user_factors = FactorOverlay(self.model.user_factors)
+        self.item_factors = FactorOverlay(self.model.item_factors)
+        self.ann_index = None
+        self.quantized_items = None
+
+    def fold_in_user(self, user_id: UUID, book_ids: List[UUID], ratings: List[float],
+                     interactions: pd.DataFrame = None) -> 'BookRecommender':
+        """Copy of the recommender with one user's ALS factors recomputed from their current ratings.
+
+        Solves the user's least-squares problem against the fixed item
+        factors, so rating changes and new users are served without a full
+        retrain. `interactions` is the user's (book_id, confidence) implicit
+        feedback, added to the ratings as train_als does; pass it so the
+        folded-in row keeps what the trained row had. Books rated but unknown
+        to the model get factors folded in from this user and are appended to
+        the item mapping, interactions on unknown books are dropped. The new rows go to
+        overlays the copy shares with this recommender, which keeps serving
+        what it served before, so a fold-in costs the same however many
+        users and items the model has.
+        """
+        updated = copy.copy(self)
+        new_items = [bid for bid in dict.fromkeys(book_ids) if bid not in self.item_mapping]
+        if new_items:
+            updated.item_mapping = self.item_mapping.extended(new_items)
+        if user_id not in self.user_mapping:
+            updated.user_mapping = self.user_mapping.extended([user_id])
+        user_idx = updated.user_mapping[user_id]
+
+        cols = updated.item_mapping.encode(book_ids)
+        values = np.asarray(ratings, dtype=np.float32)
+        if interactions is not None and len(interactions):
+            interaction_cols = updated.item_mapping.encode(interactions['book_id'])
+            known_interactions = interaction_cols >= 0
+            cols = np.concatenate((cols, interaction_cols[known_interactions]))
+            values = np.concatenate((
+                values, interactions['confidence'].to_numpy(dtype=np.float32)[known_interactions]
+            ))
+        # Duplicate books are summed
+        user_row = coo_matrix(
+            (values, (np.zeros(len(cols), dtype=np.int64), cols)),
+            shape=(1, len(updated.item_mapping))
+        ).tocsr()
+        user_row.sort_indices()
+        confidence = user_row.data * self.model.alpha
+        regularization = self.model.regularization
+
+        known = user_row.indices < len(self.item_factors)
+        factors = _least_squares(
+            self.item_factors.take(user_row.indices[known]), self.model.YtY + self.item_factors.gram_delta,
+            confidence[known], regularization
+        )
+        if new_items:
+            # Each new item is solved against this user alone, then the user against every rated item
+            old_factors = self.user_factors.take([user_idx])[0].astype(np.float64)
+            user_gram = (self.model.XtX + self.user_factors.gram_delta
+                         + np.outer(factors, factors) - np.outer(old_factors, old_factors))
+            new_idx = updated.item_mapping.encode(new_items)
+            new_confidence = confidence[np.searchsorted(user_row.indices, new_idx)]
+            updated.item_factors = self.item_factors.with_rows(new_idx, np.stack([
+                _least_squares(factors[None], user_gram, new_confidence[i:i + 1], regularization)
+                for i in range(len(new_idx))
+            ]))
+            factors = _least_squares(
+                updated.item_factors.take(user_row.indices), self.model.YtY + updated.item_factors.gram_delta,
+                confidence, regularization
+            )
+
+        updated.user_factors = self.user_factors.with_rows([user_idx], factors[None])
+        updated.user_item_updates = self.user_item_updates.with_values([user_idx], [user_row])
+        return updated
+
+    def _user_items(self, user_idx: int) -> csr_matrix:
+        """The user's current row of the user-item matrix, including folded-in updates"""
+        row = self.user_item_updates.get(user_idx)
+        if row is None:
+            row = self.user_item_matrix[user_idx] if user_idx < self.user_item_matrix.shape[0] else csr_matrix((1, 0))
+        return _resized(row, (1, len(self.item_mapping)))
 
-    def als_recommend(self, user_id, n=5):
+    def _merged_user_items(self) -> csr_matrix:
+        """The user-item matrix with folded-in rows written back"""
+        shape = (len(self.user_mapping), len(self.item_mapping))
+        updates = dict(self.user_item_updates.items())
+        if not updates:
+            return _resized(self.user_item_matrix, shape)
+        keep = np.ones(shape[0])
+        keep[list(updates)] = 0
+        rows = updates.values()
+        updates = coo_matrix(
+            (np.concatenate([row.data for row in rows]),
+             (np.concatenate([np.full(row.nnz, user_idx) for user_idx, row in updates.items()]),
+              np.concatenate([row.indices for row in rows]))),
+            shape=shape
+        )
+        return (diags(keep) @ _resized(self.user_item_matrix, shape) + updates).tocsr()
+
+    def build_ann_index(self, n_lists=None, n_probe=8):
+        """Build an approximate nearest-neighbour index over the ALS item factors"""
+        self.ann_index = IVFIndex(n_lists=n_lists, n_probe=n_probe).fit(self.model.item_factors)
+
+    def quantize_item_factors(self, oversample=4):
+        """Serve ALS from int8 item factors, rescoring the best oversample * n candidates in full precision"""
+        self.quantized_items = QuantizedFactors.from_factors(self.model.item_factors, oversample=oversample)
+
+    def als_recommend(self, user_id, n=5, n_probe=None):
         """Get top-N recommendations for a user"""
         if user_id not in self.user_mapping:
             raise ValueError(f"User {user_id} not found in training data")
 
         user_idx = self.user_mapping[user_id]
 
-        # Get recommendations - returns (item_indices, scores) tuple
-        item_indices, _ = self.model.recommend(
-            userid=user_idx,
-            user_items=self.user_item_matrix[user_idx],
-            N=n,
-            filter_already_liked_items=True
-        )
+        with span("als_scoring"):
+            item_indices, _ = self._als_top_n(np.array([user_idx]), self._user_items(user_idx), n, n_probe=n_probe)
+            item_indices = item_indices[0][item_indices[0] >= 0]
 
         # Convert indices back to UUIDs
-        return [self.item_inverse_mapping[item_idx] for item_idx in item_indices]
+        with span("metadata"):
+            return list(self.item_mapping.decode(item_indices))
+
+    def als_recommend_batch(self, user_ids: List[UUID], n: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-N ALS item indices and scores for many known users in one call.
+
+        Returns two (len(user_ids), n) arrays; slots that could not be filled
+        have index -1.
+        """
+        with span("als_scoring"):
+            user_idx = self.user_mapping.encode(user_ids)
+            if (user_idx < 0).any():
+                raise KeyError(user_ids[int(np.argmax(user_idx < 0))])
+            if len(self.user_item_updates) or len(self.item_mapping) > self.user_item_matrix.shape[1]:
+                user_items = vstack([self._user_items(idx) for idx in user_idx], format='csr')
+            else:
+                user_items = self.user_item_matrix[user_idx]
+            return self._als_top_n(user_idx, user_items, n)
+
+    def _als_top_n(self, user_idx: np.ndarray, user_items: csr_matrix, n: int, n_probe=None):
+        """Top-n (item indices, scores) per user, skipping the items in their user_items row.
+
+        The ANN index and int8 factors only cover the trained items, items
+        folded in since are scored exactly and merged in.
+        """
+        queries = self.user_factors.take(user_idx)
+        n_trained = len(self.model.item_factors)
+        trained_items = user_items[:, :n_trained]
+        item_indices = np.full((len(user_idx), n), -1, dtype=np.int64)
+        scores = np.zeros((len(user_idx), n), dtype=np.float32)
+
+        if self.ann_index is not None:
+            for i, query in enumerate(queries):
+                ids, item_scores = self.ann_index.search(
+                    query, n, exclude=trained_items[i].indices, n_probe=n_probe
+                )
+                item_indices[i, :len(ids)] = ids
+                scores[i, :len(ids)] = item_scores
+        elif self.quantized_items is not None:
+            item_indices, scores = self.quantized_items.search(
+                queries, n, self.model.item_factors, exclude=trained_items
+            )
+        else:
+            ids, item_scores = topk(
+                self.model.item_factors, queries, min(n, n_trained), filter_query_items=trained_items,
+                num_threads=self.model.num_threads
+            )
+            # Slots left after filtering come back with the lowest float32 score
+            found = item_scores > np.finfo(np.float32).min
+            filled = ids.shape[1]
+            item_indices[:, :filled] = np.where(found, ids, -1)
+            scores[:, :filled] = np.where(found, item_scores, 0)
+
+        if self.item_factors.n_rows == n_trained:
+            return item_indices, scores
+        new_scores = queries @ self.item_factors.appended().T
+        new_items = user_items[:, n_trained:].tocoo()
+        new_scores[new_items.row, new_items.col] = -np.inf
+        candidates = np.hstack((item_indices, np.broadcast_to(
+            np.arange(n_trained, self.item_factors.n_rows), new_scores.shape)))
+        candidate_scores = np.hstack((np.where(item_indices >= 0, scores, -np.inf), new_scores))
+        order = np.argsort(-candidate_scores, axis=1, kind='stable')[:, :n]
+        found = np.isfinite(np.take_along_axis(candidate_scores, order, axis=1))
+        return (np.where(found, np.take_along_axis(candidates, order, axis=1), -1),
+                np.where(found, np.take_along_axis(candidate_scores, order, axis=1), 0).astype(np.float32))
+
+    def save(self, root: str) -> str:
+        """Persist the trained state as a new artifact version under root"""
+        arrays = {
+            **self.book_index.to_arrays('books.ids'),
+            'books.titles': np.array(self.book_titles, dtype=str),
+            'books.authors': np.array(self.book_authors, dtype=str),
+            **self.rated_user_index.to_arrays('rated.user_ids'),
+            'rated.counts': self.rated_counts,
+            **sparse_to_arrays('rated', self.rated_matrix),
+        }
+        manifest = {'models': []}
+
+        if self.collab_model is not None:
+            manifest['models'].append('collaborative')
+            manifest['collaborative'] = {
+                'k': self.collab_model.k,
+                'min_k': self.collab_model.min_k,
+                'global_mean': self.collab_model.global_mean,
+                'rating_scale': list(self.collab_model.rating_scale),
+            }
+            arrays.update({f'collab.{name}': array for name, array in self.collab_model.to_arrays().items()})
+
+        if self.content_model is not None:
+            manifest['models'].append('content')
+            manifest['content'] = {**self.content_features.params(), 'top_k': self.content_top_k}
+            arrays.update({
+                **{f'content.{name}': array for name, array in self.content_features.to_arrays().items()},
+                **sparse_to_arrays('content.tfidf', self.tfidf_matrix.to_csr()),
+                **sparse_to_arrays('content.similarity', self.content_model.to_csr()),
+            })
+
+        ann_index, quantized_items = self.ann_index, self.quantized_items
+        if self.model is not None:
+            item_factors = self.item_factors.to_array()
+            # Both only cover the trained items, rebuild them when items were folded in since
+            if ann_index is not None and len(ann_index.ids) != len(item_factors):
+                ann_index = IVFIndex(n_lists=ann_index.n_lists, n_probe=ann_index.n_probe).fit(item_factors)
+            if quantized_items is not None and len(quantized_items) != len(item_factors):
+                quantized_items = QuantizedFactors.from_factors(
+                    item_factors, oversample=quantized_items.oversample, block_size=quantized_items.block_size
+                )
+            manifest['models'].append('als')
+            manifest['als'] = {
+                'factors': int(self.model.factors),
+                'regularization': float(self.model.regularization),
+            }
+            arrays.update({
+                **self.user_mapping.to_arrays('als.user_ids'),
+                **self.item_mapping.to_arrays('als.item_ids'),
+                'als.user_factors': self.user_factors.to_array(),
+                'als.item_factors': item_factors,
+                **sparse_to_arrays('als.user_items', self._merged_user_items()),
+            })
+
+        if ann_index is not None:
+            manifest['models'].append('ann')
+            manifest['ann'] = {'n_probe': ann_index.n_probe}
+            arrays.update({f'ann.{name}': array for name, array in ann_index.to_arrays().items()})
+
+        if quantized_items is not None:
+            manifest['models'].append('quantized')
+            manifest['quantized'] = {'oversample': quantized_items.oversample}
+            arrays.update({
+                f'als.quantized.{name}': array for name, array in quantized_items.to_arrays().items()
+            })
+
+        path = save_version(root, arrays, manifest)
+        self.artifact_version = os.path.basename(path)
+        return path
+
+    def load(self, root: str) -> bool:
+        """Load the current artifact version under root with memory-mapped arrays.
+
+        Returns False when there is no artifact compatible with this code.
+        """
+        path = current_version(root)
+        if path is None:
+            return False
+        manifest, arrays = load_version(path)
+
+        self.book_index = IdEncoder.from_arrays('books.ids', arrays)
+        self.book_titles = arrays['books.titles']
+        self.book_authors = arrays['books.authors']
+        self.rated_user_index = IdEncoder.from_arrays('rated.user_ids', arrays)
+        self.rated_counts = arrays['rated.counts']
+        self.rated_matrix = arrays_to_sparse('rated', arrays)
+
+        if 'collaborative' in manifest['models']:
+            params = manifest['collaborative']
+            self.collab_model = ItemKNN.from_arrays(
+                {name[len('collab.'):]: array for name, array in arrays.items() if name.startswith('collab.')},
+                k=params['k'],
+                min_k=params['min_k'],
+                rating_scale=params['rating_scale'],
+                global_mean=params['global_mean']
+            )
+
+        if 'content' in manifest['models']:
+            # Artifacts written before the content parameters were stored use a vocabulary
+            params = manifest.get('content', {})
+            self.content_features = ContentFeatures.from_arrays(
+                {name: arrays[f'content.{name}'] for name in ('idf', 'terms') if f'content.{name}' in arrays},
+                hashing=params.get('hashing', False),
+                n_features=params.get('n_features', 2 ** 18)
+            )
+            self.tfidf_matrix = PatchedMatrix(arrays_to_sparse('content.tfidf', arrays))
+            self.content_model = PatchedMatrix(arrays_to_sparse('content.similarity', arrays))
+            self.content_top_k = params.get('top_k') or int(np.diff(self.content_model.base.indptr).max(initial=0))
+
+        if 'als' in manifest['models']:
+            self.user_mapping = IdEncoder.from_arrays('als.user_ids', arrays)
+            self.item_mapping = IdEncoder.from_arrays('als.item_ids', arrays)
+            self.user_item_matrix = arrays_to_sparse('als.user_items', arrays)
+            self.user_item_updates = Overlay()
+            self.model = implicit.als.AlternatingLeastSquares(
+                factors=manifest['als']['factors'],
+                regularization=manifest['als'].get('regularization', 0.01)
+            )
+            self.model.user_factors = arrays['als.user_factors']
+            self.model.item_factors = arrays['als.item_factors']
+            self.user_factors = FactorOverlay(self.model.user_factors)
+            self.item_factors = FactorOverlay(self.model.item_factors)
+
+        if 'ann' in manifest['models']:
+            self.ann_index = IVFIndex.from_arrays(
+                {name: arrays[f'ann.{name}'] for name in ('centroids', 'vectors', 'ids', 'offsets')},
+                n_probe=manifest['ann']['n_probe']
+            )
+
+        if 'quantized' in manifest['models']:
+            self.quantized_items = QuantizedFactors.from_arrays(
+                {name: arrays[f'als.quantized.{name}'] for name in ('codes', 'scales')},
+                oversample=manifest['quantized']['oversample']
+            )
+
+        self.artifact_version = manifest['version']
+        return True
+
+
+def _least_squares(fixed: np.ndarray, gram: np.ndarray, confidence: np.ndarray, regularization: float) -> np.ndarray:
+    """Implicit ALS factors of one row from the fixed factors of its nonzero entries and their confidences.
+
+    `gram` is fixed.T @ fixed over every row of the fixed side, not only
+    the nonzero ones.
+    """
+    fixed = fixed.astype(np.float64)
+    a = gram + regularization * np.eye(len(gram)) + (fixed.T * (confidence - 1)) @ fixed
+    return np.linalg.solve(a, confidence @ fixed).astype(np.float32)
+
 
+def _resized(matrix: csr_matrix, shape) -> csr_matrix:
+    """Grow a CSR matrix with empty rows/columns (or drop trailing columns) without copying its data"""
+    rows, cols = shape
+    if matrix.shape == shape:
+        return matrix
+    if cols < matrix.shape[1]:
+        matrix = matrix[:, :cols]
+    indptr = np.concatenate((matrix.indptr, np.full(rows - matrix.shape[0], matrix.indptr[-1])))
+    return csr_matrix((matrix.data, matrix.indices, indptr), shape=shape, copy=False)
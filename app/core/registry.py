@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import os
+import threading
+from typing import Callable, Optional
+
+import pandas as pd
+
+from app.core.artifacts import CURRENT_FILE
+from app.core.config import settings
+from app.core.recommender import BookRecommender
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    """Process-wide holder of the active BookRecommender snapshot.
+
+    A reload builds a complete new recommender from the current artifact
+    and only then replaces the reference, so a request that grabbed
+    `active` keeps using one consistent snapshot.
+    """
+
+    def __init__(self, artifact_dir: str):
+        self.artifact_dir = artifact_dir
+        self.active = BookRecommender()
+        self._lock = threading.Lock()
+        self._watcher: Optional[asyncio.Task] = None
+
+    @property
+    def version(self) -> Optional[str]:
+        return self.active.artifact_version
+
+    def load(self) -> bool:
+        """Load the current artifact into a new snapshot and swap it in.
+
+        Loading and indexing happen outside the lock, which is only held
+        for the swap, so updates through swap() wait for the swap alone,
+        not for the whole reload.
+        """
+        recommender = BookRecommender()
+        if not recommender.load(self.artifact_dir):
+            return False
+        if recommender.artifact_version == self.version:
+            return True
+        if settings.ALS_ANN_INDEX and recommender.ann_index is None and recommender.model is not None:
+            recommender.build_ann_index(n_lists=settings.ALS_ANN_N_LISTS, n_probe=settings.ALS_ANN_N_PROBE)
+        if settings.ALS_QUANTIZED and recommender.quantized_items is None and recommender.model is not None:
+            recommender.quantize_item_factors(oversample=settings.ALS_QUANTIZED_OVERSAMPLE)
+        with self._lock:
+            if recommender.artifact_version != self.version:
+                self.active = recommender
+        return True
+
+    def swap(self, derive: Callable[[BookRecommender], Optional[BookRecommender]]) -> bool:
+        """Replace the active snapshot with derive(active).
+
+        derive must return a new recommender and leave the one it is given
+        unchanged, or return None to keep it. It runs under the lock so
+        concurrent updates build on each other instead of being lost.
+        Updates last until the next artifact is loaded.
+        """
+        with self._lock:
+            updated = derive(self.active)
+            if updated is None:
+                return False
+            self.active = updated
+            return True
+
+    def update_books(self, books: pd.DataFrame) -> bool:
+        """Swap in a snapshot with new or edited books in the content index.
+
+        Returns False when the active snapshot has no content model. Edits
+        last until the next artifact is loaded, which is trained on the
+        catalog as it is then.
+        """
+        return self.swap(lambda active: active.with_books(books) if active.content_model is not None else None)
+
+    async def reload(self) -> bool:
+        """Load off the event loop"""
+        return await asyncio.get_running_loop().run_in_executor(None, self.load)
+
+    def _current_pointer(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.artifact_dir, CURRENT_FILE)) as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    async def _watch(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            pointer = self._current_pointer()
+            if pointer is not None and pointer != self.version:
+                try:
+                    await self.reload()
+                except Exception:
+                    logger.exception("Model reload from %s failed", self.artifact_dir)
+
+    def start_watching(self, interval: float):
+        """Reload whenever the artifact directory's CURRENT version changes"""
+        if self._watcher is None:
+            self._watcher = asyncio.get_running_loop().create_task(self._watch(interval))
+
+    def stop_watching(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+
+
+registry = ModelRegistry(settings.MODEL_ARTIFACT_DIR)
@@ -0,0 +1,31 @@
+import numpy as np
+from scipy.sparse import issparse
+
+
+def top_n_indices(scores: np.ndarray, n: int, exclude=None) -> np.ndarray:
+    """Indices of the n highest scores, best first (ties keep catalog order)"""
+    if exclude is not None and len(exclude):
+        scores = np.array(scores, dtype=np.promote_types(scores.dtype, np.float32))
+        scores[exclude] = -np.inf
+    n = min(n, len(scores))
+    if n <= 0:
+        return np.empty(0, dtype=np.int64)
+    if n < len(scores):
+        candidates = np.argpartition(-scores, n - 1)[:n]
+    else:
+        candidates = np.arange(len(scores))
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order]
+
+
+def weighted_similarity_sum(user_row, similarity) -> np.ndarray:
+    """Sum of similarity rows weighted by a sparse (1 x n_books) rating row"""
+    return weighted_similarity_sum_rows(user_row, similarity).ravel()
+
+
+def weighted_similarity_sum_rows(user_rows, similarity) -> np.ndarray:
+    """Dense (n_users x n_books) version of weighted_similarity_sum for a batch of rating rows"""
+    scores = user_rows @ similarity
+    if issparse(scores):
+        scores = scores.toarray()
+    return np.asarray(scores, dtype=np.float32)
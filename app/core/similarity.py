@@ -0,0 +1,135 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.preprocessing import normalize
+
+from app.core.overlay import PatchedMatrix
+
+
+def build_topk_similarity(features, k: int = 100, max_block_elements: int = 2 ** 24,
+                          n_jobs: int = 1) -> csr_matrix:
+    """Cosine similarity index keeping only the top k neighbours of every row.
+
+    Rows are processed in blocks of at most `max_block_elements` dense
+    similarity cells, so peak memory is bounded by the block plus the
+    n x k result instead of the full n x n matrix. With n_jobs > 1 blocks
+    run on that many threads (the sparse product and top-k selection
+    release the GIL) and share the same memory bound. The row itself is
+    kept as its own neighbour, zero similarities are dropped.
+    """
+    features = normalize(csr_matrix(features, dtype=np.float32), norm='l2', copy=False)
+    n = features.shape[0]
+    k = min(k, n)
+    if k == 0:
+        return csr_matrix((n, n), dtype=np.float32)
+
+    features_t = features.T.tocsr()
+    n_jobs = max(1, n_jobs)
+    block_size = max(1, max_block_elements // n_jobs // n)
+    indices = np.empty((n, k), dtype=np.int32)
+    data = np.empty((n, k), dtype=np.float32)
+
+    def fill(start):
+        stop = min(start + block_size, n)
+        block = (features[start:stop] @ features_t).toarray()
+        np.negative(block, out=block)
+        top = np.argpartition(block, k - 1, axis=1)[:, :k]
+        indices[start:stop] = top
+        data[start:stop] = -np.take_along_axis(block, top, axis=1)
+
+    starts = range(0, n, block_size)
+    if n_jobs == 1:
+        for start in starts:
+            fill(start)
+    else:
+        with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            list(pool.map(fill, starts))
+
+    similarity = csr_matrix(
+        (data.ravel(), indices.ravel(), np.arange(0, n * k + 1, k)),
+        shape=(n, n)
+    )
+    similarity.eliminate_zeros()
+    similarity.sort_indices()
+    return similarity
+
+
+def update_topk_rows(similarity: PatchedMatrix, features: PatchedMatrix, rows, k: int = 100) -> PatchedMatrix:
+    """Top-k index with the neighbours of `rows` recomputed from their current features.
+
+    `features` holds the current, L2-normalized features of every row,
+    including new rows past the end of `similarity`. The given rows get
+    their own k nearest neighbours and are offered to every other row as a
+    neighbour: they fill a free slot or replace the weakest neighbour they
+    beat. Entries for the given rows left from their old features are
+    dropped first. Only those rows and the rows that change are patched;
+    finding them costs one pass over the features and over the stored
+    column indices, no copy of either matrix.
+    """
+    n = features.shape[0]
+    rows = np.unique(np.asarray(rows, dtype=np.int64))
+    k = min(k, n)
+    changed = normalize(features.rows(rows), norm='l2', copy=False)
+    scores = (features @ changed.T).T
+
+    updated = np.zeros(n, dtype=bool)
+    updated[rows] = True
+    stale = similarity.rows_with_columns(rows)
+    stale = stale[~updated[stale]]
+    # Rows any of the given rows could enter, judged on their stored neighbours
+    offered_to = np.flatnonzero((scores > 0).any(axis=0) & ~updated)
+    counts, weakest = similarity.row_minimums(offered_to)
+    enters = (counts < k) | (scores[:, offered_to].max(axis=0) > weakest)
+    candidates = np.union1d(stale, offered_to[enters])
+
+    # Candidate rows as they are, without entries for the given rows
+    coo = similarity.rows(candidates).tocoo()
+    keep = ~updated[coo.col]
+    kept_rows, kept_cols, kept_data = coo.row[keep], coo.col[keep], coo.data[keep]
+    order = np.argsort(kept_rows, kind='stable')
+    kept_rows, kept_cols, kept_data = kept_rows[order], kept_cols[order], kept_data[order]
+
+    # Weakest neighbour and free slots of every candidate
+    m = len(candidates)
+    counts = np.bincount(kept_rows, minlength=m)
+    weakest = np.full(m, np.inf, dtype=np.float32)
+    nonempty = np.flatnonzero(counts)
+    if len(nonempty):
+        starts = np.concatenate(([0], np.cumsum(counts)))[nonempty]
+        weakest[nonempty] = np.minimum.reduceat(kept_data, starts)
+    candidate_scores = scores[:, candidates]
+    offered, targets = np.nonzero(candidate_scores > 0)
+    wins = (counts[targets] < k) | (candidate_scores[offered, targets] > weakest[targets])
+    offered, targets = offered[wins], targets[wins]
+
+    # Re-rank the candidates that gained a neighbour or lost a stale one
+    touched = np.zeros(m, dtype=bool)
+    touched[targets] = True
+    touched[np.searchsorted(candidates, stale)] = True
+    pool = touched[kept_rows]
+    pool_rows = np.concatenate((kept_rows[pool], targets))
+    pool_cols = np.concatenate((kept_cols[pool], rows[offered]))
+    pool_data = np.concatenate((kept_data[pool], candidate_scores[offered, targets]))
+    order = np.lexsort((-pool_data, pool_rows))
+    pool_rows, pool_cols, pool_data = pool_rows[order], pool_cols[order], pool_data[order]
+    rank = np.arange(len(pool_rows)) - np.searchsorted(pool_rows, pool_rows)
+    best = rank < k
+
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1).ravel()
+    positive = top_scores > 0
+
+    # Patched rows: the touched candidates, then the given rows
+    touched_ids = np.flatnonzero(touched)
+    local = np.zeros(m, dtype=np.int64)
+    local[touched_ids] = np.arange(len(touched_ids))
+    patch = csr_matrix(
+        (np.concatenate((pool_data[best], top_scores[positive])),
+         (np.concatenate((local[pool_rows[best]], len(touched_ids) + np.repeat(np.arange(len(rows)), k)[positive])),
+          np.concatenate((pool_cols[best], top.ravel()[positive])))),
+        shape=(len(touched_ids) + len(rows), n),
+        dtype=np.float32
+    )
+    patch.sort_indices()
+    return similarity.with_rows(np.concatenate((candidates[touched_ids], rows)), patch)
@@ -0,0 +1,197 @@
+"""Offline training of the recommender models.
+
+Usage: python -m app.core.train [--artifact-dir artifacts] [--chunksize 100000] [--workers 3] [--threads 2]
+
+Streams ratings from Postgres straight into a sparse matrix, reads books
+and aggregated interactions in chunks, trains every model
+BookRecommender supports and writes a new artifact version that the API
+loads on startup.
+
+The collaborative, content and ALS models are independent, with
+--workers > 1 they are trained concurrently in forked worker processes
+that share the loaded inputs copy-on-write. Every worker is limited to
+--threads BLAS/OpenMP threads and uses as many threads for its blockwise
+similarity computation, so workers x threads should not exceed the cores.
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from threadpoolctl import threadpool_limits
+
+from app.core.config import settings
+from app.core.interactions import confidence_weights
+from app.core.loader import load_ratings_matrix
+from app.core.recommender import BookRecommender
+from app.db.postgres.session import engine
+
+
+# Training inputs inherited by forked workers, set only while a pool is running
+_shared = {}
+
+
+def report_stage(name: str, elapsed: float, peak_rss_mb: float):
+    print(f"{name:<20} {elapsed:8.2f} s   peak RSS {peak_rss_mb:8.1f} MB", flush=True)
+
+
+@contextmanager
+def stage(name: str):
+    """Print wall time and peak RSS of a training stage"""
+    started = time.perf_counter()
+    yield
+    report_stage(name, time.perf_counter() - started, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+
+
+def read_chunked(query: str, connection, chunksize: int) -> pd.DataFrame:
+    """Run a query with a server-side cursor and concatenate the chunks"""
+    chunks = pd.read_sql(
+        query,
+        connection.execution_options(stream_results=True),
+        chunksize=chunksize
+    )
+    return pd.concat(list(chunks), ignore_index=True)
+
+
+def load_training_data(chunksize: int):
+    with engine.connect() as connection:
+        books = read_chunked("SELECT id, title, author, genres, description FROM books", connection, chunksize)
+        interactions = read_chunked(
+            "SELECT user_id, book_id, interaction_type, COUNT(*) AS events, SUM(duration) AS duration "
+            "FROM interactions GROUP BY user_id, book_id, interaction_type",
+            connection, chunksize
+        )
+    user_ids, ratings = load_ratings_matrix(books['id'].to_numpy(), chunksize)
+    return user_ids, ratings, books, confidence_weights(interactions)
+
+
+# Attributes each training stage sets on the recommender
+STAGE_OUTPUTS = {
+    "collaborative": ("collab_model",),
+    "content": ("content_features", "content_top_k", "tfidf_matrix", "content_model"),
+    "als": ("model", "user_mapping", "item_mapping", "user_item_matrix", "user_item_updates", "user_factors",
+            "item_factors"),
+}
+
+
+def run_stage(recommender: BookRecommender, name: str, threads: int, interactions: pd.DataFrame = None):
+    if name == "collaborative":
+        recommender.train_collaborative(n_jobs=threads)
+    elif name == "content":
+        recommender.train_content_based(n_jobs=threads, hashing=settings.CONTENT_HASHING,
+                                        n_features=settings.CONTENT_HASH_FEATURES)
+    elif name == "als":
+        recommender.train_als(interactions=interactions, num_threads=threads)
+
+
+def _init_worker(threads: int):
+    threadpool_limits(threads)
+
+
+def _train_stage(name: str, threads: int):
+    """Worker side of train_models_parallel, returns the trained attributes and stage timing"""
+    recommender = _shared["recommender"]
+    started = time.perf_counter()
+    run_stage(recommender, name, threads, _shared["interactions"])
+    elapsed = time.perf_counter() - started
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return name, {attr: getattr(recommender, attr) for attr in STAGE_OUTPUTS[name]}, elapsed, peak_rss_mb
+
+
+def train_models(recommender: BookRecommender, user_ids: np.ndarray, ratings: csr_matrix, books: pd.DataFrame,
+                 ann_index: bool = False, interactions: pd.DataFrame = None, threads: int = 1,
+                 quantized: bool = False):
+    """Train every model on the given data one after another, interactions only feed ALS"""
+    with stage("load_data"):
+        recommender.load_matrix(user_ids, ratings, books)
+    with threadpool_limits(threads):
+        for name in STAGE_OUTPUTS:
+            with stage(name):
+                run_stage(recommender, name, threads, interactions)
+    if ann_index:
+        with stage("ann_index"):
+            recommender.build_ann_index(n_lists=settings.ALS_ANN_N_LISTS, n_probe=settings.ALS_ANN_N_PROBE)
+    if quantized:
+        with stage("quantize"):
+            recommender.quantize_item_factors(oversample=settings.ALS_QUANTIZED_OVERSAMPLE)
+
+
+def train_models_parallel(recommender: BookRecommender, user_ids: np.ndarray, ratings: csr_matrix,
+                          books: pd.DataFrame, ann_index: bool = False, interactions: pd.DataFrame = None,
+                          workers: int = 3, threads: int = 1, quantized: bool = False):
+    """Same result as train_models, with the independent models trained in forked worker processes.
+
+    Workers are forked after the inputs are loaded so they read them from
+    shared pages instead of pickled copies; only the trained models travel
+    back to the parent. Stage timings are measured inside the workers, the
+    peak RSS reported is the worker's own.
+    """
+    with stage("load_data"):
+        recommender.load_matrix(user_ids, ratings, books)
+
+    _shared.update(recommender=recommender, interactions=interactions)
+    try:
+        with stage("train_parallel"):
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork"),
+                                     initializer=_init_worker, initargs=(threads,)) as pool:
+                futures = [pool.submit(_train_stage, name, threads) for name in STAGE_OUTPUTS]
+                for future in as_completed(futures):
+                    name, outputs, elapsed, peak_rss_mb = future.result()
+                    for attr, value in outputs.items():
+                        setattr(recommender, attr, value)
+                    report_stage(f"  {name}", elapsed, peak_rss_mb)
+    finally:
+        _shared.clear()
+
+    if ann_index:
+        with stage("ann_index"):
+            recommender.build_ann_index(n_lists=settings.ALS_ANN_N_LISTS, n_probe=settings.ALS_ANN_N_PROBE)
+    if quantized:
+        with stage("quantize"):
+            recommender.quantize_item_factors(oversample=settings.ALS_QUANTIZED_OVERSAMPLE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--artifact-dir", default=settings.MODEL_ARTIFACT_DIR)
+    parser.add_argument("--chunksize", type=int, default=100000)
+    parser.add_argument("--ann-index", action="store_true", default=settings.ALS_ANN_INDEX,
+                        help="also build the approximate ALS index")
+    parser.add_argument("--quantized", action="store_true", default=settings.ALS_QUANTIZED,
+                        help="also store int8 ALS item factors for serving")
+    cpus = os.cpu_count() or 1
+    parser.add_argument("--workers", type=int, default=min(len(STAGE_OUTPUTS), cpus),
+                        help="models trained concurrently, 1 trains them one after another")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="BLAS/OpenMP and similarity threads per model (default: cores / workers)")
+    args = parser.parse_args()
+    workers = max(1, args.workers)
+    threads = args.threads or max(1, cpus // workers)
+
+    with stage("fetch"):
+        user_ids, ratings, books, interactions = load_training_data(args.chunksize)
+    print(f"{ratings.nnz} ratings by {len(user_ids)} users, {len(books)} books, "
+          f"{len(interactions)} interaction pairs", flush=True)
+
+    recommender = BookRecommender()
+    if workers > 1:
+        train_models_parallel(recommender, user_ids, ratings, books, ann_index=args.ann_index,
+                              interactions=interactions, workers=workers, threads=threads,
+                              quantized=args.quantized)
+    else:
+        train_models(recommender, user_ids, ratings, books, ann_index=args.ann_index,
+                     interactions=interactions, threads=cpus if args.threads is None else threads,
+                     quantized=args.quantized)
+    with stage("save"):
+        path = recommender.save(args.artifact_dir)
+    print(f"artifact written to {path}")
+
+
+if __name__ == "__main__":
+    main()
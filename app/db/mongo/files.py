@@ -0,0 +1,65 @@
+import re
+from typing import AsyncIterator, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket, AsyncIOMotorGridOut
+
+# Matches the GridFS default chunk size, so each read maps to one chunk document
+CHUNK_SIZE = 255 * 1024
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def pdf_bucket(database) -> AsyncIOMotorGridFSBucket:
+    return AsyncIOMotorGridFSBucket(database, bucket_name="pdfs", chunk_size_bytes=CHUNK_SIZE)
+
+
+async def find_pdf(bucket: AsyncIOMotorGridFSBucket, book_id) -> Optional[AsyncIOMotorGridOut]:
+    """Readable stream of the latest uploaded PDF of a book"""
+    cursor = bucket.find({"metadata.book_id": str(book_id)}).sort("uploadDate", -1).limit(1)
+    files = await cursor.to_list(length=1)
+    if not files:
+        return None
+    # find() yields plain file documents, open the file itself to read it
+    return await bucket.open_download_stream(files[0]["_id"])
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Inclusive (start, end) byte range of a single-range `Range` header.
+
+    Returns None when the header is absent or not a byte range we serve
+    (the whole file is sent then), raises RangeNotSatisfiable when the
+    range lies outside the file.
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first == "":
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+async def iter_range(grid_out: AsyncIOMotorGridOut, start: int, end: int) -> AsyncIterator[bytes]:
+    """Yield the bytes start..end (inclusive) one chunk at a time"""
+    grid_out.seek(start)
+    remaining = end - start + 1
+    while remaining > 0:
+        data = await grid_out.read(min(CHUNK_SIZE, remaining))
+        if not data:
+            break
+        remaining -= len(data)
+        yield data
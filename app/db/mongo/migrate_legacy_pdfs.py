@@ -0,0 +1,57 @@
+"""One-off copy of PDFs stored inline in the legacy `books` collection into GridFS.
+
+Usage: python -m app.db.mongo.migrate_legacy_pdfs [--delete]
+
+Before GridFS, uploads were stored as single documents with the whole file
+in `pdf_data`. Every such document whose book has no GridFS file yet is
+written to the `pdfs` bucket with the metadata the download endpoint looks
+up. Books that already have a GridFS upload keep it, it is newer. With
+--delete the legacy documents are removed once copied. Safe to re-run.
+"""
+import argparse
+
+from gridfs import GridFSBucket
+from pymongo import MongoClient
+
+from app.core.config import settings
+from app.db.mongo.files import CHUNK_SIZE
+from app.db.mongo.session import MONGO_URI
+
+LEGACY_COLLECTION = "books"
+
+
+def migrate(database, delete: bool = False) -> dict:
+    bucket = GridFSBucket(database, bucket_name="pdfs", chunk_size_bytes=CHUNK_SIZE)
+    legacy = database[LEGACY_COLLECTION]
+    counts = {"copied": 0, "skipped": 0, "deleted": 0}
+    for doc in legacy.find({"pdf_data": {"$exists": True}}):
+        book_id = doc["book_id"]
+        if database["pdfs.files"].find_one({"metadata.book_id": book_id}, projection={"_id": 1}) is None:
+            bucket.upload_from_stream(
+                doc.get("filename") or f"{book_id}.pdf",
+                bytes(doc["pdf_data"]),
+                metadata={"book_id": book_id, "content_type": doc.get("content_type", "application/pdf")}
+            )
+            counts["copied"] += 1
+        else:
+            counts["skipped"] += 1
+        if delete:
+            legacy.delete_one({"_id": doc["_id"]})
+            counts["deleted"] += 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--delete", action="store_true", help="remove legacy documents once copied")
+    args = parser.parse_args()
+
+    client = MongoClient(MONGO_URI)
+    try:
+        print(migrate(client[settings.MONGO_DB], delete=args.delete))
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+from typing import Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from app.core.config import settings
+
+MONGO_URI = (
+    f"mongodb://"
+    f"{settings.MONGO_USER}:{settings.MONGO_PASSWORD}@"
+    f"{settings.MONGO_HOST}:{settings.MONGO_PORT}"
+)
+
+client: Optional[AsyncIOMotorClient] = None
+
+
+def connect_mongo():
+    """Create the shared async client; call once the event loop is running"""
+    global client
+    client = AsyncIOMotorClient(
+        MONGO_URI,
+        maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+        minPoolSize=settings.MONGO_MIN_POOL_SIZE
+    )
+
+
+def close_mongo():
+    global client
+    if client is not None:
+        client.close()
+        client = None
+
+
+def get_mongo_db() -> AsyncIOMotorDatabase:
+    """Dependency for getting the Mongo database"""
+    return client[settings.MONGO_DB]
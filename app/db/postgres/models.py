@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Float, ARRAY, Boolean, DateTime, func, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, Float, ARRAY, Boolean, DateTime, func, ForeignKey, Index
 from sqlalchemy.dialects.postgresql import UUID
 from app.db.base import Base
 import uuid
@@ -41,6 +41,10 @@ class User(Base):
 
 class Rating(Base):
     __tablename__ = 'ratings'
+    __table_args__ = (
+        Index('ix_ratings_user_id_book_id', 'user_id', 'book_id', unique=True, postgresql_include=['rating']),
+        Index('ix_ratings_book_id', 'book_id', postgresql_include=['user_id', 'rating']),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
@@ -54,6 +58,10 @@ class Rating(Base):
 
 class Recommendation(Base):
     __tablename__ = 'recommendations'
+    __table_args__ = (
+        Index('ix_recommendations_user_id_algorithm_score', 'user_id', 'algorithm', 'score',
+              postgresql_include=['book_id', 'generated_at']),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
@@ -68,6 +76,10 @@ class Recommendation(Base):
 
 class Interaction(Base):
     __tablename__ = 'interactions'
+    __table_args__ = (
+        Index('ix_interactions_user_id_interacted_at', 'user_id', 'interacted_at'),
+        Index('ix_interactions_book_id', 'book_id'),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
@@ -78,3 +90,29 @@ class Interaction(Base):
 
     def __repr__(self):
         return f"<Interaction {self.interaction_type} on {self.book_id} by {self.user_id}>"
+
+
+class BookRatingStats(Base):
+    __tablename__ = 'book_rating_stats'
+
+    book_id = Column(UUID(as_uuid=True), ForeignKey('books.id', ondelete='CASCADE'), primary_key=True)
+    rating_count = Column(Integer, nullable=False, default=0)
+    rating_sum = Column(Float, nullable=False, default=0.0)
+    rating_sum_sq = Column(Float, nullable=False, default=0.0)
+    last_rated_at = Column(DateTime(timezone=True))
+
+    def __repr__(self):
+        return f"<BookRatingStats {self.rating_count} ratings for book {self.book_id}>"
+
+
+class UserRatingStats(Base):
+    __tablename__ = 'user_rating_stats'
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    rating_count = Column(Integer, nullable=False, default=0)
+    rating_sum = Column(Float, nullable=False, default=0.0)
+    rating_sum_sq = Column(Float, nullable=False, default=0.0)
+    last_rated_at = Column(DateTime(timezone=True))
+
+    def __repr__(self):
+        return f"<UserRatingStats {self.rating_count} ratings by user {self.user_id}>"
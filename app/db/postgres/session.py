@@ -2,6 +2,7 @@ from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, scoped_session
 from app.core.config import settings  # Your config file
+from app.core.metrics import instrument_engine
 
 # Database URL typically comes from your config
 SQLALCHEMY_DATABASE_URL = (
@@ -12,6 +13,7 @@ SQLALCHEMY_DATABASE_URL = (
 )
 
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
+instrument_engine(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -32,8 +34,13 @@ async_engine = create_async_engine(
     f"postgresql+asyncpg://"
     f"{settings.DB_USER}:{settings.DB_PASSWORD}@"
     f"{settings.DB_HOST}:{settings.DB_PORT}/"
-    f"{settings.DB_NAME}"
+    f"{settings.DB_NAME}",
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_pre_ping=True
 )
+instrument_engine(async_engine.sync_engine)
 
 AsyncSessionLocal = sessionmaker(
     async_engine, class_=AsyncSession, expire_on_commit=False
@@ -1,11 +1,71 @@
-from fastapi import FastAPI
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
 from app.api.v1.router.router import api_router
+from app.core.config import settings
+from app.core.metrics import REQUEST_SECONDS, SamplingProfiler, metrics, server_timing, start_request_spans
+from app.db.mongo.session import connect_mongo, close_mongo
 
 app = FastAPI(title="My FastAPI App", version="0.1.0")
 
 app.include_router(api_router, prefix="/api/v1")
 
 
+def route_template(request: Request) -> str:
+    """Path template of the matched route, e.g. /api/v1/books/{book_id}, so metric labels stay bounded"""
+    route = request.scope.get("route")
+    return route.path_format if route is not None else "unmatched"
+
+
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    """Observe request latency per route template and report the request's spans in Server-Timing.
+
+    With PROFILE_DIR set, a request carrying an X-Profile header is also
+    sampled and its folded stacks are written to a file named in the
+    X-Profile-File response header.
+    """
+    profiler = None
+    if settings.PROFILE_DIR and request.headers.get("X-Profile"):
+        profiler = SamplingProfiler(settings.PROFILE_INTERVAL)
+        profiler.start()
+    spans = start_request_spans()
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        route_path = route_template(request)
+        REQUEST_SECONDS.observe(time.perf_counter() - started, request.method, route_path, status_code)
+        if profiler is not None:
+            profiler.stop()
+            profile_path = profiler.dump(settings.PROFILE_DIR, f"{request.method} {route_path}")
+
+    if spans:
+        response.headers["Server-Timing"] = server_timing(spans)
+    if profiler is not None:
+        response.headers["X-Profile-File"] = profile_path
+    return response
+
+
+@app.on_event("startup")
+async def startup_event():
+    connect_mongo()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    close_mongo()
+
+
 @app.get("/")
 def read_root():
     return {"message": "Welcome to FastAPI!"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Latency histograms in the Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Literal
 from uuid import UUID
 
 from pydantic import BaseModel, Field, confloat
@@ -53,3 +53,24 @@ class RatingResponse(RatingBase):
     rated_at: datetime
     user_id: UUID
     book_id: UUID
+
+
+class BatchRecommendationRequest(BaseModel):
+    """Schema for scoring many users in one call"""
+    user_ids: List[UUID] = Field(..., description="Users to recommend for")
+    algorithm: Literal["hybrid", "als"] = Field("als", description="Scoring algorithm")
+    limit: int = Field(5, ge=1, le=100, description="Recommendations per user")
+
+
+class InteractionEvent(BaseModel):
+    """Schema for one implicit-feedback event"""
+    user_id: UUID
+    book_id: UUID
+    interaction_type: Literal["view", "click", "purchase"]
+    interacted_at: Optional[datetime] = Field(None, description="Event time, defaults to when it is stored")
+    duration: Optional[confloat(ge=0)] = Field(None, description="Seconds spent on the book")
+
+
+class InteractionBatch(BaseModel):
+    """Schema for submitting many interaction events in one call"""
+    events: List[InteractionEvent] = Field(..., max_length=10000)
@@ -0,0 +1,63 @@
+"""Recall@N and latency of the IVF index against exact ALS scoring.
+
+Usage: python -m benchmarks.ann_recall --items 1000000 --probes 1 4 8 16 32
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.core.ann import IVFIndex
+from app.core.scoring import top_n_indices
+
+
+def synthetic_factors(n: int, factors: int, clusters: int, rng) -> np.ndarray:
+    """Clustered factor vectors, roughly the shape ALS embeddings take"""
+    centers = rng.normal(size=(clusters, factors)).astype(np.float32)
+    labels = rng.integers(0, clusters, n)
+    return centers[labels] + 0.5 * rng.normal(size=(n, factors)).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--items', type=int, default=100000)
+    parser.add_argument('--factors', type=int, default=50)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--liked', type=int, default=20, help='already-liked items filtered per query')
+    parser.add_argument('--n', type=int, default=10)
+    parser.add_argument('--n-lists', type=int, default=None)
+    parser.add_argument('--probes', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    item_factors = synthetic_factors(args.items, args.factors, 200, rng)
+    user_factors = synthetic_factors(args.queries, args.factors, 200, rng)
+    liked = [rng.choice(args.items, args.liked, replace=False) for _ in range(args.queries)]
+
+    started = time.perf_counter()
+    index = IVFIndex(n_lists=args.n_lists).fit(item_factors)
+    print({'items': args.items, 'n_lists': index.n_lists, 'build_seconds': round(time.perf_counter() - started, 2)})
+
+    exact, exact_latency = [], []
+    for user, exclude in zip(user_factors, liked):
+        started = time.perf_counter()
+        exact.append(set(top_n_indices(item_factors @ user, args.n, exclude=exclude)))
+        exact_latency.append(time.perf_counter() - started)
+    print({'mode': 'exact', 'p50_ms': round(float(np.percentile(exact_latency, 50)) * 1000, 3),
+           'p99_ms': round(float(np.percentile(exact_latency, 99)) * 1000, 3)})
+
+    for n_probe in args.probes:
+        hits, latency = 0, []
+        for user, exclude, truth in zip(user_factors, liked, exact):
+            started = time.perf_counter()
+            ids, _ = index.search(user, args.n, exclude=exclude, n_probe=n_probe)
+            latency.append(time.perf_counter() - started)
+            hits += len(truth.intersection(ids))
+        print({'mode': 'ivf', 'n_probe': n_probe,
+               f'recall@{args.n}': round(hits / (args.n * args.queries), 4),
+               'p50_ms': round(float(np.percentile(latency, 50)) * 1000, 3),
+               'p99_ms': round(float(np.percentile(latency, 99)) * 1000, 3)})
+
+
+if __name__ == '__main__':
+    main()
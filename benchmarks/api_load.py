@@ -0,0 +1,66 @@
+"""Latency and throughput of API endpoints under concurrent load.
+
+Runs against a live server:
+
+    python -m benchmarks.api_load --base-url http://localhost:8000 \
+        --paths /api/v1/books /api/v1/statistics/avg-books-rating --concurrency 64
+
+Each of --concurrency workers issues requests round-robin over --paths
+until --requests have been sent. Handlers that block the event loop or
+serialize on one shared session show up as throughput that stays flat as
+concurrency grows. Requires httpx.
+"""
+import argparse
+import asyncio
+import itertools
+import time
+
+import httpx
+import numpy as np
+
+
+async def worker(client: httpx.AsyncClient, paths, remaining: itertools.count, total: int, latency, errors):
+    for path in paths:
+        if next(remaining) >= total:
+            return
+        started = time.perf_counter()
+        try:
+            response = await client.get(path)
+            response.raise_for_status()
+        except httpx.HTTPError:
+            errors.append(path)
+            continue
+        latency.append(time.perf_counter() - started)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://localhost:8000')
+    parser.add_argument('--paths', nargs='+', default=['/api/v1/books'])
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    latency, errors = [], []
+    remaining = itertools.count()
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=None) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            worker(client, itertools.cycle(args.paths), remaining, args.requests, latency, errors)
+            for _ in range(args.concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+
+    print({
+        'concurrency': args.concurrency,
+        'requests': len(latency),
+        'errors': len(errors),
+        'requests_per_s': round(len(latency) / elapsed, 1),
+        'p50_ms': round(float(np.percentile(latency, 50)) * 1000, 2) if latency else None,
+        'p99_ms': round(float(np.percentile(latency, 99)) * 1000, 2) if latency else None,
+    })
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,199 @@
+"""Offline quality and speed benchmark of every recommender algorithm.
+
+Usage: python -m benchmarks.evaluate --users 20000 --books 5000 --ratings-per-user 30 --output baseline.json
+
+Generates a synthetic catalog and ratings with latent taste clusters and a
+Zipf popularity skew, holds out a share of every user's ratings and trains
+all models on the rest. Reports per-stage training time and peak RSS,
+latency percentiles and throughput of hybrid_recommend, get_similar_books
+and als_recommend, and precision@K, recall@K and NDCG@K of the hybrid and
+ALS rankings against the held-out ratings of 4 or more. The JSON output
+is meant to be diffed against a baseline run.
+"""
+import argparse
+import json
+import resource
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from app.core.recommender import BookRecommender
+
+GENRES = ['fantasy', 'science', 'history', 'romance', 'mystery', 'poetry', 'travel', 'cooking',
+          'horror', 'biography', 'drama', 'comics']
+
+
+def synthetic_data(n_users: int, n_books: int, ratings_per_user: int, skew: float, seed: int = 42):
+    """(ratings, books) frames; users prefer books of their taste cluster, popular books get more ratings"""
+    rng = np.random.default_rng(seed)
+    n_clusters = len(GENRES)
+    book_cluster = rng.integers(0, n_clusters, n_books)
+    user_cluster = rng.integers(0, n_clusters, n_users)
+    popularity = 1.0 / np.arange(1, n_books + 1) ** skew
+    popularity = popularity[rng.permutation(n_books)]
+
+    users = np.repeat(np.arange(n_users), ratings_per_user)
+    # Half of every user's ratings come from their own cluster
+    in_cluster = rng.random(len(users)) < 0.5
+    books = rng.choice(n_books, size=len(users), p=popularity / popularity.sum())
+    by_cluster = [np.flatnonzero(book_cluster == cluster) for cluster in range(n_clusters)]
+    for cluster, members in enumerate(by_cluster):
+        rows = np.flatnonzero(in_cluster & (user_cluster[users] == cluster))
+        if len(members) and len(rows):
+            weights = popularity[members] / popularity[members].sum()
+            books[rows] = rng.choice(members, size=len(rows), p=weights)
+    match = book_cluster[books] == user_cluster[users]
+    ratings = np.clip(np.rint(np.where(match, 4.2, 2.6) + rng.normal(0, 0.8, len(users))), 1, 5)
+
+    user_ids = np.array([uuid.UUID(int=int(i) + 1) for i in range(n_users)], dtype=object)
+    book_ids = np.array([uuid.UUID(int=(1 << 64) + int(i)) for i in range(n_books)], dtype=object)
+    ratings_df = pd.DataFrame({
+        'user_id': user_ids[users],
+        'book_id': book_ids[books],
+        'rating': ratings,
+    }).drop_duplicates(['user_id', 'book_id'])
+    books_df = pd.DataFrame({
+        'id': book_ids,
+        'title': [f'book{i} volume{i % 7}' for i in range(n_books)],
+        'author': [f'author{i % max(n_books // 5, 1)}' for i in range(n_books)],
+        'genres': [[GENRES[cluster], GENRES[(cluster + 1) % n_clusters]] for cluster in book_cluster],
+    })
+    return ratings_df, books_df
+
+
+def holdout_split(ratings: pd.DataFrame, test_share: float, seed: int = 42):
+    """Hold out test_share of the ratings of every user with at least 5"""
+    rng = np.random.default_rng(seed)
+    counts = ratings.groupby('user_id')['rating'].transform('size')
+    test = (counts >= 5).to_numpy() & (rng.random(len(ratings)) < test_share)
+    return ratings[~test], ratings[test]
+
+
+def timed(stages: dict, name: str, run):
+    started = time.perf_counter()
+    result = run()
+    stages[name] = {
+        'seconds': round(time.perf_counter() - started, 3),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    return result
+
+
+def latency(call, args) -> dict:
+    durations = []
+    started = time.perf_counter()
+    for arg in args:
+        call_started = time.perf_counter()
+        call(arg)
+        durations.append(time.perf_counter() - call_started)
+    elapsed = time.perf_counter() - started
+    durations = np.array(durations) * 1000
+    return {
+        'calls': len(durations),
+        'p50_ms': round(float(np.percentile(durations, 50)), 3),
+        'p95_ms': round(float(np.percentile(durations, 95)), 3),
+        'p99_ms': round(float(np.percentile(durations, 99)), 3),
+        'per_second': round(len(durations) / elapsed, 1),
+    }
+
+
+def ranking_metrics(recommended: dict, relevant: dict, k: int) -> dict:
+    """Mean precision@k, recall@k and NDCG@k over users with relevant items"""
+    discounts = 1.0 / np.log2(np.arange(2, k + 2))
+    precision, recall, ndcg = [], [], []
+    for user_id, items in relevant.items():
+        ranked = recommended.get(user_id, [])[:k]
+        hits = np.array([item in items for item in ranked], dtype=float)
+        precision.append(hits.sum() / k)
+        recall.append(hits.sum() / len(items))
+        ideal = discounts[:min(len(items), k)].sum()
+        ndcg.append((hits * discounts[:len(hits)]).sum() / ideal)
+    return {
+        f'precision@{k}': round(float(np.mean(precision)), 4),
+        f'recall@{k}': round(float(np.mean(recall)), 4),
+        f'ndcg@{k}': round(float(np.mean(ndcg)), 4),
+        'users': len(relevant),
+    }
+
+
+def top_unseen(indices: np.ndarray, encoder, seen: dict, user_ids, k: int) -> dict:
+    """Top-k decoded ids per user, skipping books the user rated in training"""
+    result = {}
+    for user_id, row in zip(user_ids, indices):
+        books = encoder.decode(row[row >= 0])
+        result[user_id] = [book for book in books if book not in seen.get(user_id, ())][:k]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--books', type=int, default=5000)
+    parser.add_argument('--ratings-per-user', type=int, default=30)
+    parser.add_argument('--skew', type=float, default=1.0, help='Zipf exponent of book popularity')
+    parser.add_argument('--test-share', type=float, default=0.2)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--eval-users', type=int, default=2000)
+    parser.add_argument('--latency-calls', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write the JSON report to this file instead of stdout')
+    args = parser.parse_args()
+
+    ratings, books = synthetic_data(args.users, args.books, args.ratings_per_user, args.skew, args.seed)
+    train, test = holdout_split(ratings, args.test_share, args.seed)
+
+    stages = {}
+    recommender = BookRecommender()
+    timed(stages, 'load_data', lambda: recommender.load_data(train, books))
+    timed(stages, 'collaborative', recommender.train_collaborative)
+    timed(stages, 'content', recommender.train_content_based)
+    timed(stages, 'als', recommender.train_als)
+
+    rng = np.random.default_rng(args.seed)
+    relevant_test = test[test['rating'] >= 4]
+    relevant = relevant_test.groupby('user_id')['book_id'].apply(set).to_dict()
+    eval_users = [user_id for user_id in relevant if user_id in recommender.user_mapping]
+    eval_users = [eval_users[i] for i in rng.permutation(len(eval_users))[:args.eval_users]]
+    relevant = {user_id: relevant[user_id] for user_id in eval_users}
+    seen = train[train['user_id'].isin(eval_users)].groupby('user_id')['book_id'].apply(set).to_dict()
+    # Ask for enough extra results to fill k after dropping already rated books
+    depth = args.k + max((len(items) for items in seen.values()), default=0)
+
+    hybrid, als = {}, {}
+    for start in range(0, len(eval_users), 256):
+        chunk = eval_users[start:start + 256]
+        indices, _ = recommender.hybrid_recommend_batch(chunk, depth)
+        hybrid.update(top_unseen(indices, recommender.book_index, seen, chunk, args.k))
+        indices, _ = recommender.als_recommend_batch(chunk, depth)
+        als.update(top_unseen(indices, recommender.item_mapping, seen, chunk, args.k))
+
+    latency_users = [eval_users[i % len(eval_users)] for i in range(args.latency_calls)]
+    latency_books = books['id'].to_numpy()[rng.integers(0, len(books), args.latency_calls)]
+    report = {
+        'config': vars(args),
+        'data': {'users': args.users, 'books': args.books, 'train_ratings': len(train), 'test_ratings': len(test)},
+        'training': stages,
+        'latency': {
+            'hybrid_recommend': latency(lambda user_id: recommender.hybrid_recommend(user_id, args.k), latency_users),
+            'get_similar_books': latency(lambda book_id: recommender.get_similar_books(book_id, args.k),
+                                         latency_books),
+            'als_recommend': latency(lambda user_id: recommender.als_recommend(user_id, args.k), latency_users),
+        },
+        'quality': {
+            'hybrid': ranking_metrics(hybrid, relevant, args.k),
+            'als': ranking_metrics(als, relevant, args.k),
+        },
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
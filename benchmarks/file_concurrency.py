@@ -0,0 +1,77 @@
+"""Latency of book metadata reads while PDF downloads are in flight.
+
+Runs against a live server. Upload a large PDF for --book-id first, then:
+
+    python -m benchmarks.file_concurrency --base-url http://localhost:8000 --book-id <uuid>
+
+The probe reads the book's metadata (GET /api/v1/books/{id}, a database
+query). Its latency is measured once on an idle server and once while
+--downloads concurrent PDF transfers are running. With a blocking driver
+the probes queue behind the transfers; with the async driver they should
+stay close to the idle numbers. Requires httpx.
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+import numpy as np
+
+
+async def download(client: httpx.AsyncClient, url: str, stop: asyncio.Event) -> int:
+    transferred = 0
+    while not stop.is_set():
+        async with client.stream("GET", url) as response:
+            async for chunk in response.aiter_bytes():
+                transferred += len(chunk)
+    return transferred
+
+
+async def probe(client: httpx.AsyncClient, url: str, count: int):
+    latency = []
+    for _ in range(count):
+        started = time.perf_counter()
+        response = await client.get(url)
+        response.raise_for_status()
+        latency.append(time.perf_counter() - started)
+    return latency
+
+
+def summary(name: str, latency) -> dict:
+    return {
+        'phase': name,
+        'p50_ms': round(float(np.percentile(latency, 50)) * 1000, 2),
+        'p99_ms': round(float(np.percentile(latency, 99)) * 1000, 2),
+        'max_ms': round(max(latency) * 1000, 2),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://localhost:8000')
+    parser.add_argument('--book-id', required=True, help='book with an uploaded PDF')
+    parser.add_argument('--probe-path', help="defaults to the book's metadata")
+    parser.add_argument('--downloads', type=int, default=16)
+    parser.add_argument('--probes', type=int, default=200)
+    args = parser.parse_args()
+
+    download_url = f'/api/v1/books/download-book/{args.book_id}'
+    probe_path = args.probe_path or f'/api/v1/books/{args.book_id}'
+    limits = httpx.Limits(max_connections=args.downloads + 4)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=None) as client:
+        print(summary('idle', await probe(client, probe_path, args.probes)))
+
+        stop = asyncio.Event()
+        downloads = [asyncio.create_task(download(client, download_url, stop)) for _ in range(args.downloads)]
+        await asyncio.sleep(1)
+        started = time.perf_counter()
+        busy = await probe(client, probe_path, args.probes)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        transferred = sum(await asyncio.gather(*downloads))
+        print({**summary(f'{args.downloads} downloads', busy),
+               'download_mb_per_s': round(transferred / 2 ** 20 / elapsed, 1)})
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+"""Memory per id and lookup throughput of IdEncoder against the UUID dicts it replaced.
+
+Usage: python -m benchmarks.id_encoding --sizes 100000 1000000
+"""
+import argparse
+import time
+import tracemalloc
+import uuid
+
+import numpy as np
+
+from app.core.ids import IdEncoder
+
+
+def measure(build):
+    tracemalloc.start()
+    result = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current
+
+
+def run(n_ids: int, n_queries: int) -> dict:
+    ids = [uuid.uuid4() for _ in range(n_ids)]
+    queries = [ids[i] for i in np.random.default_rng(0).integers(0, n_ids, n_queries)]
+
+    # The old layout: a forward and an inverse dict per mapping
+    (forward, inverse), dict_bytes = measure(
+        lambda: ({uid: idx for idx, uid in enumerate(ids)}, dict(enumerate(ids)))
+    )
+    encoder, encoder_bytes = measure(lambda: IdEncoder.from_ids(ids))
+
+    started = time.perf_counter()
+    dict_codes = np.array([forward[uid] for uid in queries])
+    dict_encode = time.perf_counter() - started
+    started = time.perf_counter()
+    encoder_codes = encoder.encode(queries)
+    encoder_encode = time.perf_counter() - started
+    assert (dict_codes == encoder_codes).all()
+
+    started = time.perf_counter()
+    [inverse[code] for code in dict_codes]
+    dict_decode = time.perf_counter() - started
+    started = time.perf_counter()
+    encoder.decode(encoder_codes)
+    encoder_decode = time.perf_counter() - started
+
+    return {
+        'ids': n_ids,
+        'dict_bytes_per_id': round(dict_bytes / n_ids, 1),
+        'encoder_bytes_per_id': round(encoder_bytes / n_ids, 1),
+        'dict_encode_per_s': round(n_queries / dict_encode),
+        'encoder_encode_per_s': round(n_queries / encoder_encode),
+        'dict_decode_per_s': round(n_queries / dict_decode),
+        'encoder_decode_per_s': round(n_queries / encoder_decode),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--queries', type=int, default=100000)
+    args = parser.parse_args()
+    for n_ids in args.sizes:
+        print(run(n_ids, args.queries), flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Ranking agreement, memory and latency of int8 item factors against exact float32 ALS scoring.
+
+Usage: python -m benchmarks.quantization --items 1000000 --oversample 1 2 4 8
+"""
+import argparse
+import time
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from app.core.quantize import QuantizedFactors
+from benchmarks.ann_recall import synthetic_factors
+
+
+def exact_top_n(item_factors: np.ndarray, queries: np.ndarray, liked: csr_matrix, n: int) -> np.ndarray:
+    scores = queries @ item_factors.T
+    rows = np.repeat(np.arange(liked.shape[0]), np.diff(liked.indptr))
+    scores[rows, liked.indices] = -np.inf
+    top = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(top, order, axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--items', type=int, default=100000)
+    parser.add_argument('--factors', type=int, default=50)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--batch', type=int, default=64, help='queries scored per call')
+    parser.add_argument('--liked', type=int, default=20, help='already-liked items filtered per query')
+    parser.add_argument('--n', type=int, default=10)
+    parser.add_argument('--oversample', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    item_factors = synthetic_factors(args.items, args.factors, 200, rng)
+    user_factors = synthetic_factors(args.queries, args.factors, 200, rng)
+    liked = csr_matrix(
+        (np.ones(args.queries * args.liked, dtype=np.float32),
+         np.concatenate([rng.choice(args.items, args.liked, replace=False) for _ in range(args.queries)]),
+         np.arange(0, args.queries * args.liked + 1, args.liked)),
+        shape=(args.queries, args.items)
+    )
+    batches = range(0, args.queries, args.batch)
+
+    quantized = QuantizedFactors.from_factors(item_factors)
+    print({'items': args.items, 'factors': args.factors,
+           'float64_mb': round(item_factors.astype(np.float64).nbytes / 2 ** 20, 1),
+           'float32_mb': round(item_factors.nbytes / 2 ** 20, 1),
+           'int8_mb': round(quantized.nbytes / 2 ** 20, 1)})
+
+    started = time.perf_counter()
+    exact = np.concatenate([
+        exact_top_n(item_factors, user_factors[start:start + args.batch], liked[start:start + args.batch], args.n)
+        for start in batches
+    ])
+    print({'mode': 'exact float32', 'ms_per_query': round((time.perf_counter() - started) * 1000 / args.queries, 3)})
+
+    for oversample in args.oversample:
+        quantized.oversample = oversample
+        started = time.perf_counter()
+        ids = np.concatenate([
+            quantized.search(user_factors[start:start + args.batch], args.n, item_factors,
+                             exclude=liked[start:start + args.batch])[0]
+            for start in batches
+        ])
+        elapsed = time.perf_counter() - started
+        hits = sum(len(np.intersect1d(found, truth)) for found, truth in zip(ids, exact))
+        print({'mode': 'int8 + rescoring', 'oversample': oversample,
+               f'recall@{args.n}': round(hits / (args.n * args.queries), 4),
+               'same_order': round(float((ids == exact).all(axis=1).mean()), 4),
+               'ms_per_query': round(elapsed * 1000 / args.queries, 3)})
+
+
+if __name__ == '__main__':
+    main()
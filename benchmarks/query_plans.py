@@ -0,0 +1,119 @@
+"""EXPLAIN ANALYZE timings of the hot rating, recommendation and interaction queries.
+
+Usage: python -m benchmarks.query_plans --ratings 1000000 --output plans.json
+
+Seeds synthetic rows into a scratch schema (dropped afterwards) of the
+database configured in settings, runs each query without secondary
+indexes, then creates the indexes declared on the models and runs them
+again. Prints one JSON record per query with the planner's top node and
+execution time for both runs.
+"""
+import argparse
+import json
+
+from sqlalchemy import text
+from sqlalchemy.schema import CreateIndex
+
+from app.db.postgres.models import Interaction, Rating, Recommendation
+from app.db.postgres.session import engine
+
+SCHEMA = "query_plans_bench"
+
+# Deterministic ids: user i is md5('u' || i), book j is md5('b' || j)
+SEED = {
+    "ratings": """
+        INSERT INTO ratings (id, user_id, book_id, rating, rated_at)
+        SELECT gen_random_uuid(), md5('u' || k % :users)::uuid,
+               md5('b' || (k / :users + (k % :users) * 7) % :books)::uuid,
+               1 + k % 5, now() - (k % 1000) * interval '1 hour'
+        FROM generate_series(0, :ratings - 1) k
+    """,
+    "recommendations": """
+        INSERT INTO recommendations (id, user_id, book_id, score, algorithm, generated_at)
+        SELECT gen_random_uuid(), md5('u' || k / 20 % :users)::uuid, md5('b' || k % :books)::uuid,
+               random(), (ARRAY['hybrid', 'als'])[1 + k / (20 * :users) % 2], now()
+        FROM generate_series(0, 40 * :users - 1) k
+    """,
+    "interactions": """
+        INSERT INTO interactions (id, user_id, book_id, interaction_type, interacted_at, duration)
+        SELECT gen_random_uuid(), md5('u' || k % :users)::uuid, md5('b' || k * 31 % :books)::uuid,
+               (ARRAY['view', 'click', 'purchase'])[1 + k % 3], now() - (k % 5000) * interval '1 minute', k % 600
+        FROM generate_series(0, :interactions - 1) k
+    """,
+}
+
+QUERIES = {
+    "ratings_by_user": "SELECT book_id, rating FROM ratings WHERE user_id = md5('u1')::uuid",
+    "ratings_by_book": "SELECT user_id, rating FROM ratings WHERE book_id = md5('b1')::uuid",
+    "rating_by_pair": "SELECT * FROM ratings WHERE user_id = md5('u1')::uuid AND book_id = md5('b8')::uuid",
+    "precomputed_recommendations": """
+        SELECT book_id, score FROM recommendations
+        WHERE user_id = md5('u1')::uuid AND algorithm = 'hybrid' AND generated_at >= now() - interval '1 day'
+        ORDER BY score DESC LIMIT 10
+    """,
+    "recent_interactions": """
+        SELECT book_id, interaction_type FROM interactions
+        WHERE user_id = md5('u1')::uuid ORDER BY interacted_at DESC LIMIT 50
+    """,
+    "interactions_by_book": "SELECT COUNT(*) FROM interactions WHERE book_id = md5('b1')::uuid",
+}
+
+
+def explain(connection, query: str) -> dict:
+    plan = connection.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}")).scalar()[0]
+    return {
+        "node": plan["Plan"]["Node Type"],
+        "execution_ms": round(plan["Execution Time"], 3),
+    }
+
+
+def run_queries(connection) -> dict:
+    return {name: explain(connection, query) for name, query in QUERIES.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--books", type=int, default=10000)
+    parser.add_argument("--ratings", type=int, default=1000000)
+    parser.add_argument("--interactions", type=int, default=1000000)
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+    if args.ratings > args.users * args.books:
+        parser.error("--ratings cannot exceed --users * --books")
+    params = {"users": args.users, "books": args.books, "ratings": args.ratings, "interactions": args.interactions}
+
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        connection.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        connection.execute(text(f"SET LOCAL search_path TO {SCHEMA}"))
+        try:
+            for model in (Rating, Recommendation, Interaction):
+                table = model.__tablename__
+                # Same columns and primary key as the live table, no foreign keys or secondary indexes
+                connection.execute(text(
+                    f"CREATE TABLE {table} (LIKE public.{table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+                ))
+                connection.execute(text(f"ALTER TABLE {table} ADD PRIMARY KEY (id)"))
+                connection.execute(text(SEED[table]), params)
+                connection.execute(text(f"ANALYZE {table}"))
+            before = run_queries(connection)
+
+            for model in (Rating, Recommendation, Interaction):
+                for index in model.__table__.indexes:
+                    connection.execute(CreateIndex(index))
+                connection.execute(text(f"ANALYZE {model.__tablename__}"))
+            after = run_queries(connection)
+        finally:
+            connection.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+
+    results = [{"query": name, "before": before[name], "after": after[name]} for name in QUERIES]
+    for result in results:
+        print(json.dumps(result))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"params": params, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
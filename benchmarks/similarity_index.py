@@ -0,0 +1,95 @@
+"""Build time and peak memory of the top-K content similarity index.
+
+Usage: python -m benchmarks.similarity_index --sizes 10000 30000 100000 --extrapolate 1000000
+
+Build time grows with n^2 (every row is scored against every book) and
+peak memory with the block plus the n x k result, so sizes too slow to
+run are estimated from the measured ones with --extrapolate.
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from app.core.similarity import build_topk_similarity
+
+
+def synthetic_tfidf(n_books: int, vocabulary: int = 50000, terms_per_book: int = 12, seed: int = 42) -> csr_matrix:
+    """Sparse TF-IDF-like matrix with a Zipf-distributed vocabulary"""
+    rng = np.random.default_rng(seed)
+    terms = np.minimum(rng.zipf(1.2, size=n_books * terms_per_book), vocabulary) - 1
+    rows = np.repeat(np.arange(n_books), terms_per_book)
+    # Frequent terms get low weights, as TF-IDF would give them
+    weights = np.log1p(terms).astype(np.float32) + 0.1
+    matrix = csr_matrix((weights, (rows, terms)), shape=(n_books, vocabulary), dtype=np.float32)
+    matrix.sum_duplicates()
+    return matrix
+
+
+def run(n_books: int, k: int, max_block_elements: int, n_jobs: int) -> dict:
+    features = synthetic_tfidf(n_books)
+    tracemalloc.start()
+    started = time.perf_counter()
+    index = build_topk_similarity(features, k=k, max_block_elements=max_block_elements, n_jobs=n_jobs)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    index_bytes = index.data.nbytes + index.indices.nbytes + index.indptr.nbytes
+    return {
+        'books': n_books,
+        'k': k,
+        'n_jobs': n_jobs,
+        'build_seconds': round(elapsed, 2),
+        'peak_mb': round(peak / 2 ** 20, 1),
+        'index_mb': round(index_bytes / 2 ** 20, 1),
+        'dense_mb': round(n_books ** 2 * 8 / 2 ** 20, 1),
+    }
+
+
+def extrapolate(results: list, n_books: int) -> dict:
+    """Estimate a run at `n_books` from measured ones.
+
+    Time is scaled quadratically from the largest run. Peak memory is a
+    linear fit over the runs, which must all be large enough to be split
+    into several blocks: the block is then fixed and only the n x k
+    result grows.
+    """
+    largest = max(results, key=lambda result: result['books'])
+    slope, intercept = np.polyfit([result['books'] for result in results],
+                                  [result['peak_mb'] for result in results], 1)
+    return {
+        'books': n_books,
+        'k': largest['k'],
+        'n_jobs': largest['n_jobs'],
+        'build_seconds': round(largest['build_seconds'] * (n_books / largest['books']) ** 2),
+        'peak_mb': round(float(slope * n_books + intercept), 1),
+        'index_mb': round(largest['index_mb'] * n_books / largest['books'], 1),
+        'dense_mb': round(n_books ** 2 * 8 / 2 ** 20, 1),
+        'extrapolated': True,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--k', type=int, default=100)
+    parser.add_argument('--max-block-elements', type=int, default=2 ** 24)
+    parser.add_argument('--n-jobs', type=int, default=1)
+    parser.add_argument('--extrapolate', type=int, nargs='*', default=[],
+                        help='catalog sizes to estimate from the measured ones')
+    args = parser.parse_args()
+    if args.extrapolate and (len(args.sizes) < 2 or min(args.sizes) ** 2 <= args.max_block_elements):
+        parser.error('--extrapolate needs at least two sizes above sqrt(--max-block-elements)')
+
+    results = []
+    for n_books in args.sizes:
+        results.append(run(n_books, args.k, args.max_block_elements, args.n_jobs))
+        print(results[-1], flush=True)
+    for n_books in args.extrapolate:
+        print(extrapolate(results, n_books), flush=True)
+
+
+if __name__ == '__main__':
+    main()
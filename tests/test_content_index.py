@@ -0,0 +1,47 @@
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from app.core.content import book_text
+from app.core.recommender import BookRecommender
+from app.core.similarity import build_topk_similarity
+
+WORDS = [f"term{i}" for i in range(300)]
+
+
+def catalog(n_books, rng):
+    return pd.DataFrame({
+        'id': [uuid.uuid4() for _ in range(n_books)],
+        'title': [' '.join(rng.choice(WORDS, 4)) for _ in range(n_books)],
+        'author': 'author',
+        'genres': [['fiction']] * n_books,
+        'description': [' '.join(rng.choice(WORDS, 8)) for _ in range(n_books)],
+    })
+
+
+def test_with_books_patches_rows_and_keeps_the_snapshot():
+    rng = np.random.default_rng(3)
+    books = catalog(400, rng)
+    recommender = BookRecommender()
+    recommender.load_data(pd.DataFrame(columns=['user_id', 'book_id', 'rating']), books)
+    recommender.train_content_based(top_k=15)
+    similarity = recommender.content_model.to_csr().copy()
+
+    edited = books.iloc[[5]].assign(description=' '.join(WORDS[:8]))
+    added = catalog(2, rng)
+    updated = recommender.with_books(pd.concat([edited, added]))
+
+    # The trained arrays are shared and left as they were
+    assert updated.content_model.base is recommender.content_model.base
+    assert abs(recommender.content_model.to_csr() - similarity).max() == 0
+    assert len(recommender.book_index) == 400 and len(updated.book_index) == 402
+
+    # Rows of edited and new books match a full rebuild on the updated catalog
+    current = pd.concat([books.drop(index=5), edited, added]).set_index('id').loc[list(updated.book_index)]
+    rebuilt = build_topk_similarity(recommender.content_features.transform(book_text(current)), k=15)
+    patched = updated.content_model.to_csr()
+    for book_id in [edited['id'].iloc[0], *added['id']]:
+        row = updated.book_index[book_id]
+        np.testing.assert_allclose(patched[row].toarray(), rebuilt[row].toarray(), atol=1e-6)
+    assert updated.get_similar_books(added['id'].iloc[0], top_n=3)
@@ -0,0 +1,110 @@
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from app.core.recommender import BookRecommender
+
+
+def trained_recommender(n_books=120, n_users=80, n_ratings=1500, n_interactions=0):
+    rng = np.random.default_rng(7)
+    book_ids = [uuid.uuid4() for _ in range(n_books)]
+    books = pd.DataFrame({'id': book_ids, 'title': 'title', 'author': 'author', 'genres': '', 'description': ''})
+    user_ids = [uuid.uuid4() for _ in range(n_users)]
+    ratings = pd.DataFrame({
+        'user_id': rng.choice(np.array(user_ids, dtype=object), n_ratings),
+        'book_id': rng.choice(np.array(book_ids, dtype=object), n_ratings),
+        'rating': rng.integers(1, 6, n_ratings).astype(float),
+    }).drop_duplicates(['user_id', 'book_id'])
+    recommender = BookRecommender()
+    recommender.load_data(ratings, books)
+    interactions = pd.DataFrame({
+        'user_id': rng.choice(np.array(user_ids, dtype=object), n_interactions),
+        'book_id': rng.choice(np.array(book_ids, dtype=object), n_interactions),
+        'confidence': rng.uniform(0.5, 10, n_interactions),
+    }).drop_duplicates(['user_id', 'book_id'])
+    recommender.train_als(factors=8, iterations=3, num_threads=1, interactions=interactions)
+    return recommender, ratings, book_ids, interactions
+
+
+def test_fold_in_matches_implicit_and_leaves_snapshot_unchanged():
+    recommender, ratings, _, _ = trained_recommender()
+    user_id = ratings['user_id'].iloc[0]
+    user_idx = recommender.user_mapping[user_id]
+    user_factors = recommender.model.user_factors.copy()
+    served = recommender.als_recommend(user_id, n=5)
+
+    user_ratings = ratings[ratings['user_id'] == user_id]
+    updated = recommender.fold_in_user(user_id, user_ratings['book_id'].tolist(), user_ratings['rating'].tolist())
+
+    expected = recommender.model.recalculate_user(user_idx, recommender.user_item_matrix[user_idx])
+    np.testing.assert_allclose(updated.user_factors[user_idx], expected, rtol=1e-4, atol=1e-5)
+    np.testing.assert_array_equal(recommender.model.user_factors, user_factors)
+    assert len(recommender.user_item_updates) == 0
+    assert recommender.als_recommend(user_id, n=5) == served
+    # Results cached for the user before the fold-in are keyed apart from those after it
+    assert updated.user_cache_version(user_id) != recommender.user_cache_version(user_id)
+    other_user = next(other for other in ratings['user_id'] if other != user_id)
+    assert updated.user_cache_version(other_user) == recommender.user_cache_version(other_user)
+
+
+def test_fold_in_new_user_and_book():
+    recommender, _, book_ids, _ = trained_recommender()
+    user_id, book_id = uuid.uuid4(), uuid.uuid4()
+    updated = recommender.fold_in_user(user_id, [book_ids[0], book_id], [5.0, 4.0])
+
+    assert user_id not in recommender.user_mapping and book_id not in recommender.item_mapping
+    assert len(updated.item_factors) == len(updated.item_mapping) == len(recommender.item_mapping) + 1
+    # The user's own books are filtered, the new book is ranked for everyone else
+    assert not {book_ids[0], book_id} & set(updated.als_recommend(user_id, n=10))
+    other = updated.fold_in_user(uuid.uuid4(), [book_ids[1]], [5.0])
+    ids, _ = other.als_recommend_batch([user_id], n=len(other.item_mapping))
+    assert len(ids[0][ids[0] >= 0]) == len(other.item_mapping) - 2
+
+
+def test_fold_ins_from_the_same_snapshot_do_not_share_rows():
+    recommender, _, book_ids, _ = trained_recommender()
+    first_user, second_user = uuid.uuid4(), uuid.uuid4()
+    first = recommender.fold_in_user(first_user, [book_ids[0]], [5.0])
+    second = recommender.fold_in_user(second_user, [book_ids[1]], [5.0])
+
+    assert second_user not in first.user_mapping and first_user not in second.user_mapping
+    assert first.user_item_updates.get(first.user_mapping[first_user]).indices.tolist() == [0]
+    assert second.user_item_updates.get(second.user_mapping[second_user]).indices.tolist() == [1]
+
+
+def test_fold_in_keeps_interaction_confidence():
+    recommender, ratings, _, interactions = trained_recommender(n_interactions=1500)
+    user_id = interactions['user_id'].iloc[0]
+    user_idx = recommender.user_mapping[user_id]
+    user_ratings = ratings[ratings['user_id'] == user_id]
+    user_interactions = interactions[interactions['user_id'] == user_id]
+
+    updated = recommender.fold_in_user(
+        user_id, user_ratings['book_id'].tolist(), user_ratings['rating'].tolist(), user_interactions
+    )
+
+    # Folding in unchanged data keeps the trained row, so interacted books stay filtered
+    folded = updated.user_item_updates.get(user_idx)
+    assert abs(folded - recommender.user_item_matrix[user_idx]).max() < 1e-5
+    expected = recommender.model.recalculate_user(user_idx, recommender.user_item_matrix[user_idx])
+    np.testing.assert_allclose(updated.user_factors[user_idx], expected, rtol=1e-4, atol=1e-5)
+
+
+def test_saved_fold_in_rebuilds_ann_index_and_quantized_factors(tmp_path):
+    recommender, _, book_ids, _ = trained_recommender()
+    recommender.build_ann_index(n_lists=4, n_probe=4)
+    recommender.quantize_item_factors()
+    user_id, book_id = uuid.uuid4(), uuid.uuid4()
+    updated = recommender.fold_in_user(user_id, [book_ids[0], book_id], [5.0, 4.0])
+    updated = updated.fold_in_user(uuid.uuid4(), [book_ids[1]], [5.0])
+    updated.save(str(tmp_path))
+
+    for backend in ('ann_index', 'quantized_items'):
+        loaded = BookRecommender()
+        loaded.load(str(tmp_path))
+        setattr(loaded, 'quantized_items' if backend == 'ann_index' else 'ann_index', None)
+        n_items = len(loaded.item_mapping)
+        assert len(loaded.model.item_factors) == n_items
+        # Every item but the user's own two is reachable, the new book included
+        assert len(loaded.als_recommend(user_id, n=n_items)) == n_items - 2
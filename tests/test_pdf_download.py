@@ -0,0 +1,104 @@
+import asyncio
+import uuid
+
+from app.api.v1.endpoints.books import download_book
+
+PDF = bytes(range(256)) * 4000
+
+
+class FakeGridOut:
+    """What Motor's open_download_stream returns: a readable, seekable file"""
+
+    def __init__(self, doc, data):
+        self._id = doc["_id"]
+        self.filename = doc["filename"]
+        self.metadata = doc["metadata"]
+        self.length = len(data)
+        self._data = data
+        self._position = 0
+
+    def seek(self, position):
+        self._position = position
+
+    async def read(self, size=-1):
+        end = self.length if size < 0 else self._position + size
+        chunk = self._data[self._position:end]
+        self._position += len(chunk)
+        return chunk
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def sort(self, key, direction):
+        self._docs = sorted(self._docs, key=lambda doc: doc[key], reverse=direction < 0)
+        return self
+
+    def limit(self, n):
+        self._docs = self._docs[:n]
+        return self
+
+    async def to_list(self, length):
+        return self._docs[:length]
+
+
+class FakeBucket:
+    """GridFS bucket whose find() yields plain file documents, as Motor's does"""
+
+    def __init__(self, files):
+        self._files = files
+
+    def find(self, query):
+        book_id = query["metadata.book_id"]
+        return FakeCursor([doc for doc, _ in self._files.values() if doc["metadata"]["book_id"] == book_id])
+
+    async def open_download_stream(self, file_id):
+        doc, data = self._files[file_id]
+        return FakeGridOut(doc, data)
+
+
+def make_bucket(book_id):
+    doc = {
+        "_id": "file1",
+        "filename": "book.pdf",
+        "uploadDate": 1,
+        "length": len(PDF),
+        "metadata": {"book_id": str(book_id), "content_type": "application/pdf"},
+    }
+    return FakeBucket({"file1": (doc, PDF)})
+
+
+async def fetch(book_id, bucket, range_header=None):
+    response = await download_book(book_id, range_header=range_header, if_none_match=None, pdf_files=bucket)
+    body = b""
+    if hasattr(response, "body_iterator"):
+        async for chunk in response.body_iterator:
+            body += chunk
+    return response, body
+
+
+def test_download_whole_file():
+    book_id = uuid.uuid4()
+    response, body = asyncio.run(fetch(book_id, make_bucket(book_id)))
+    assert response.status_code == 200
+    assert body == PDF
+    assert response.headers["content-length"] == str(len(PDF))
+
+
+def test_download_byte_range():
+    book_id = uuid.uuid4()
+    response, body = asyncio.run(fetch(book_id, make_bucket(book_id), range_header="bytes=1000-300000"))
+    assert response.status_code == 206
+    assert body == PDF[1000:300001]
+    assert response.headers["content-range"] == f"bytes 1000-300000/{len(PDF)}"
+
+
+def test_download_missing_book():
+    book_id = uuid.uuid4()
+    try:
+        asyncio.run(fetch(uuid.uuid4(), make_bucket(book_id)))
+    except Exception as e:
+        assert getattr(e, "status_code", None) == 404
+    else:
+        raise AssertionError("expected a 404")
@@ -0,0 +1,116 @@
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from psycopg2 import errorcodes
+from sqlalchemy.exc import IntegrityError
+
+from app.api.v1.endpoints import ratings
+from app.core.cache import result_cache
+from app.models.schemas import RatingCreate
+
+
+class FailingSession:
+    """Session whose statements all fail, as when the database drops after the rating was committed"""
+
+    def __init__(self):
+        self.rolled_back = False
+
+    def execute(self, statement):
+        raise RuntimeError("connection closed")
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        self.rolled_back = True
+
+
+def test_fold_in_failure_after_commit_is_logged_not_raised(caplog, monkeypatch):
+    db = FailingSession()
+    user_id = uuid.uuid4()
+    monkeypatch.setattr(ratings.registry, "active", SimpleNamespace(model=object()))
+    result_cache.get_or_compute("als", user_id, 5, "v1", lambda: ["cached"], user_id=user_id)
+
+    ratings.fold_in_user_ratings(db, user_id)
+
+    assert db.rolled_back
+    # Stale results are dropped even though the fold-in failed
+    assert result_cache.get_or_compute("als", user_id, 5, "v1", lambda: ["fresh"], user_id=user_id) == ["fresh"]
+    assert f"Refreshing recommendations of user {user_id} failed" in caplog.text
+
+
+class Result:
+    def __init__(self, value=None):
+        self.value = value
+
+    def scalar_one_or_none(self):
+        return self.value
+
+    def one(self):
+        return SimpleNamespace(rating_count=0, rating_sum=0.0)
+
+
+class RatingSession:
+    """Session holding one rating, answering every other statement with empty aggregates"""
+
+    def __init__(self, rating):
+        self.rating = rating
+        self.committed = False
+
+    def execute(self, statement):
+        return Result(self.rating if statement.is_select else None)
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        pass
+
+
+def test_delete_refreshes_the_users_recommendations(monkeypatch):
+    rating = SimpleNamespace(id=uuid.uuid4(), user_id=uuid.uuid4(), book_id=uuid.uuid4(), rating=4.0)
+    db = RatingSession(rating)
+    refreshed = []
+    monkeypatch.setattr(ratings, "fold_in_user_ratings", lambda session, user_id: refreshed.append(user_id))
+
+    ratings.delete_rating(rating.id, db)
+
+    assert db.committed
+    assert refreshed == [rating.user_id]
+
+
+class ConflictSession(RatingSession):
+    """Session with no rating yet whose writes violate a constraint"""
+
+    def __init__(self, pgcode, constraint_name):
+        super().__init__(None)
+        self.error = IntegrityError("INSERT", {}, SimpleNamespace(
+            pgcode=pgcode, diag=SimpleNamespace(constraint_name=constraint_name)
+        ))
+
+    def add(self, instance):
+        pass
+
+    def execute(self, statement):
+        if statement.is_select:
+            return Result(None)
+        raise self.error
+
+
+def create(db):
+    return ratings.create_rating(RatingCreate(user_id=uuid.uuid4(), book_id=uuid.uuid4(), rating=4.0), db)
+
+
+def test_create_maps_only_the_rating_pair_index_to_a_duplicate():
+    with pytest.raises(HTTPException) as duplicate:
+        create(ConflictSession(errorcodes.UNIQUE_VIOLATION, ratings.RATING_PAIR_INDEX))
+    assert duplicate.value.status_code == 400
+
+    with pytest.raises(HTTPException) as missing:
+        create(ConflictSession(errorcodes.FOREIGN_KEY_VIOLATION, "ratings_book_id_fkey"))
+    assert missing.value.status_code == 404
+
+    with pytest.raises(IntegrityError):
+        create(ConflictSession(errorcodes.CHECK_VIOLATION, "user_rating_stats_rating_count_check"))